@@ -7,6 +7,7 @@ from django.db.migrations.loader import MigrationLoader
 from django.test import override_settings
 
 from postpone_index import testing_utils
+from postpone_index.models import PostponedSQL
 
 
 def _list_migrations(app_name):
@@ -63,6 +64,39 @@ class TestCase(testing_utils.TestCase):
             self._assert_postponed_sql_empty(alias='default')
             self._assert_postponed_sql_empty(alias='additional')
 
+    def test_000_whole_migrate_parallel(self):
+        """Test the whole module migration applied by parallel jobs"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            self.assertTrue(not self._check_postponed_sql_empty(alias='default'), 'No Postponed SQL after migrations')
+            call_command('apply_postponed', 'run', '-x', '--jobs=4', '--tablespace-jobs=pg_default=2')
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty(alias='default')
+
+    def test_000_whole_migrate_postponed(self):
+        """Test the whole module migration applying postponed jobs while migrating"""
+        call_command('migrate', self.module_name)
+        baseline = self.introspect_app_schema(self.module_name)
+        call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate_postponed', self.module_name, '--jobs=2')
+            self.assertFalse(PostponedSQL.objects.filter(done=False).exists(), 'Postponed SQL not applied')
+            self.assertFalse(
+                PostponedSQL.objects.exclude(app_label=self.module_name).exists(),
+                'Postponed SQL without the originating migration'
+            )
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+            self.assertEqual(baseline, self.introspect_app_schema(self.module_name))
+
     def test_001_migrate_step_by_step(self):
         """Test migrations step by step"""
         with override_settings(
@@ -1,9 +1,1018 @@
 """Module Tests"""
 
+import datetime
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from unittest import mock
+
 from config import base_tests
 
+from django.core.management import CommandError, call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection, transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from postpone_index.management.commands.apply_postponed import (
+    Command as ApplyPostponedCommand,
+)
+from postpone_index.models import PostponedSQL
+from postpone_index.probes import StatvfsProbe
+from postpone_index.runner import Runner, Worker
+from postpone_index.windows import Window
+
 
 class ModuleTest(base_tests.TestCase):
     __doc__ = __doc__
 
     module_name = __name__.split('.')[0]
+
+    def test_004_reclaim_expired_lease(self):
+        """Test jobs leased by a crashed worker are reclaimed after the lease expires"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            PostponedSQL.objects.filter(done=False).update(
+                claimed_by='crashed',
+                lease_until=timezone.now() + datetime.timedelta(seconds=2),
+            )
+            call_command('apply_postponed', 'run', '-x')
+            self.assertFalse(PostponedSQL.objects.filter(done=False).exists())
+            self.assertFalse(PostponedSQL.objects.filter(claimed_by='crashed').exists())
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_005_all_databases(self):
+        """Test jobs of all database aliases applied in one process"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+            call_command('migrate', self.module_name, 'zero', '--database=additional')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            call_command('migrate', self.module_name, '--database=additional')
+            call_command('apply_postponed', 'run', '-x', '--all-databases', '--cluster-jobs=1')
+            self.assertFalse(PostponedSQL.objects.using('default').filter(done=False).exists())
+            self.assertFalse(PostponedSQL.objects.using('additional').filter(done=False).exists())
+            call_command('apply_postponed', 'cleanup')
+            call_command('apply_postponed', 'cleanup', '--database=additional')
+            self._assert_postponed_sql_empty(alias='default')
+            self._assert_postponed_sql_empty(alias='additional')
+
+    def test_006_skip_dependents(self):
+        """Test the failed job skips only jobs depending on it"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            failed = PostponedSQL.objects.create(description='Failed', sql='SELECT 1/0')
+            dependent = PostponedSQL.objects.create(description='Dependent', sql='SELECT 1')
+            call_command('apply_postponed', 'run')
+            self.assertFalse(PostponedSQL.objects.filter(done=False).exclude(ts__in=[failed.ts, dependent.ts]).exists())
+            self.assertTrue(PostponedSQL.objects.get(ts=failed.ts).error.startswith('Exception:'))
+            self.assertTrue(PostponedSQL.objects.get(ts=dependent.ts).error.startswith('Skipped:'))
+            call_command('apply_postponed', 'cleanup', '--all')
+
+    def test_007_policies_and_filters(self):
+        """Test jobs selected by filters and ordered by scheduling policies"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            count = PostponedSQL.objects.filter(done=False).count()
+            call_command('apply_postponed', 'run', '-x', '--policy=sjf', '--table=nonexistent_*')
+            self.assertEqual(PostponedSQL.objects.filter(done=False).count(), count)
+            call_command('apply_postponed', 'run', '-x', '--policy=priority', '--priority=*_idx=1', '--index=*')
+            self.assertFalse(PostponedSQL.objects.filter(done=False).exists())
+            PostponedSQL.objects.update(done=False)
+            call_command('apply_postponed', 'run', '-x', '--jobs=2', '--policy=locality')
+            self.assertFalse(PostponedSQL.objects.filter(done=False).exists())
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_008_maintenance_window(self):
+        """Test jobs are started only inside of the maintenance window"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            count = PostponedSQL.objects.filter(done=False).count()
+            closed = '* * * %s *' % (timezone.localtime().month % 12 + 1)
+            abort = threading.Event()
+            runner = threading.Thread(target=Runner(windows=[closed], abort=abort).run)
+            runner.start()
+            time.sleep(2)
+            abort.set()
+            runner.join()
+            self.assertEqual(PostponedSQL.objects.filter(done=False).count(), count)
+            call_command('apply_postponed', 'run', '-x', '--window=* * * * *')
+            self.assertFalse(PostponedSQL.objects.filter(done=False).exists())
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_009_time_budget(self):
+        """Test jobs not fitting the time budget are left"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            count = PostponedSQL.objects.filter(done=False).count()
+            with self.assertRaises(CommandError) as cm:
+                call_command('apply_postponed', 'run', '-x', '--deadline=%s' % timezone.now().isoformat(), stdout=io.StringIO())
+            self.assertEqual(cm.exception.returncode, 3)
+            self.assertEqual(PostponedSQL.objects.filter(done=False).count(), count)
+            call_command('apply_postponed', 'run', '-x', '--max-duration=3600')
+            self.assertFalse(PostponedSQL.objects.filter(done=False).exists())
+            self.assertFalse(PostponedSQL.objects.filter(duration__isnull=True).exists())
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_010_admission(self):
+        """Test jobs are held back while the database is loaded"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            count = PostponedSQL.objects.filter(done=False).count()
+            abort = threading.Event()
+            runner = threading.Thread(target=Runner(max_active_backends=-1, abort=abort).run)
+            runner.start()
+            time.sleep(2)
+            abort.set()
+            runner.join()
+            self.assertEqual(PostponedSQL.objects.filter(done=False).count(), count)
+            call_command(
+                'apply_postponed', 'run', '-x',
+                '--max-replication-lag=60', '--max-active-backends=100', '--max-wal-rate=1000000000'
+            )
+            self.assertFalse(PostponedSQL.objects.filter(done=False).exists())
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_011_replica_wait(self):
+        """Test jobs wait for replicas to replay before marked done"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            call_command('apply_postponed', 'run', '-x', '--replica-wait=10')
+            self.assertFalse(PostponedSQL.objects.filter(done=False).exists())
+            self.assertFalse(PostponedSQL.objects.filter(error__isnull=False).exists())
+            PostponedSQL.objects.update(done=False)
+            call_command('apply_postponed', 'run', '-x', '--jobs=4', '--replica-wait=0.1', '--replica=absent')
+            self.assertFalse(PostponedSQL.objects.filter(done=False).exists())
+            self.assertFalse(PostponedSQL.objects.exclude(error__contains='absent').exists())
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_012_interrupt(self):
+        """Test the running job is cancelled and recorded as interrupted"""
+        job = PostponedSQL.objects.create(description='Sleep', sql='SELECT pg_sleep(60)')
+        interrupted = threading.Event()
+        runner = threading.Thread(target=Runner(interrupted=interrupted).run)
+        runner.start()
+        time.sleep(2)
+        interrupted.set()
+        runner.join(10)
+        self.assertFalse(runner.is_alive())
+        job.refresh_from_db()
+        self.assertFalse(job.done)
+        self.assertEqual(job.error, 'Interrupted')
+        self.assertEqual(job.attempts, 0)
+        call_command('apply_postponed', 'cleanup', '--all')
+
+    def test_013_timeout(self):
+        """Test the job exceeding the timeout is cancelled while others are applied"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            job = PostponedSQL.objects.create(description='Sleep', sql='SELECT pg_sleep(60)', table='sleepy')
+            call_command('apply_postponed', 'run', '--jobs=2', '--timeout=60', '--table-timeout=sleep*=1')
+            self.assertFalse(PostponedSQL.objects.filter(done=False).exclude(ts=job.ts).exists())
+            job.refresh_from_db()
+            self.assertEqual(job.error, 'Timeout: exceeded 1 seconds')
+            call_command('apply_postponed', 'cleanup', '--all')
+
+    def test_014_retry(self):
+        """Test transient errors are retried while permanent ones fail immediately"""
+        transient = PostponedSQL.objects.create(
+            description='Deadlock', table='deadlock',
+            sql="DO $$ BEGIN RAISE EXCEPTION 'deadlock' USING ERRCODE = '40P01'; END $$",
+        )
+        permanent = PostponedSQL.objects.create(description='Division', table='division', sql='SELECT 1/0')
+        call_command('apply_postponed', 'run', '--max-attempts=3', '--retry-backoff=0.1')
+        transient.refresh_from_db()
+        permanent.refresh_from_db()
+        self.assertEqual(transient.attempts, 3)
+        self.assertTrue(transient.error.startswith('Exception:'))
+        self.assertEqual(permanent.attempts, 1)
+        call_command('apply_postponed', 'cleanup', '--all')
+
+    def test_015_blockers(self):
+        """Test sessions idle in transaction blocking jobs are detected and terminated"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            started = threading.Event()
+            finished = threading.Event()
+
+            def block():
+                try:
+                    with transaction.atomic(), connection.cursor() as cursor:
+                        # The snapshot of the repeatable read transaction is held until the end
+                        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                        cursor.execute('SELECT txid_current()')
+                        started.set()
+                        finished.wait(60)
+                except Exception:
+                    pass
+                finally:
+                    connection.close()
+
+            blocker = threading.Thread(target=block)
+            blocker.start()
+            started.wait(10)
+            try:
+                call_command('apply_postponed', 'run', '-x', '--terminate-idle-in-transaction=1')
+            finally:
+                finished.set()
+                blocker.join()
+            self.assertFalse(PostponedSQL.objects.filter(done=False).exists())
+            blockers = [json.loads(j.blockers) for j in PostponedSQL.objects.filter(blockers__isnull=False)]
+            self.assertTrue(blockers)
+            self.assertTrue(all(b['terminated'] for bb in blockers for b in bb))
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_016_session(self):
+        """Test session profiles are applied to the job connection"""
+        PostponedSQL.objects.using('default')._create_base_tables()
+        check = (
+            "DO $$ BEGIN IF current_setting('%s') <> '%s' THEN "
+            "RAISE EXCEPTION '%%', current_setting('%s'); END IF; END $$"
+        )
+        default = PostponedSQL.objects.create(
+            description='Default', table='default', sql=check % ('maintenance_work_mem', '77MB', 'maintenance_work_mem'),
+        )
+        table = PostponedSQL.objects.create(
+            description='Table', table='hot', sql=check % ('maintenance_work_mem', '99MB', 'maintenance_work_mem'),
+        )
+        explicit = PostponedSQL.objects.create(
+            description='Explicit', table='hot2', sql=check % ('statement_timeout', '1h', 'statement_timeout'),
+        )
+        unlimited = PostponedSQL.objects.create(
+            description='Unlimited', table='any', sql=check % ('statement_timeout', '0', 'statement_timeout'),
+        )
+        with override_settings(
+            POSTPONE_INDEX_SESSION={'maintenance_work_mem': '77MB'},
+            POSTPONE_INDEX_TABLE_SESSIONS={'hot*': {'maintenance_work_mem': '99MB'}},
+        ):
+            call_command('apply_postponed', 'run', '-x', '--session=statement_timeout=1h', '--table=hot2')
+            call_command('apply_postponed', 'run', '-x', '--adaptive-session')
+        for job in (default, table, explicit, unlimited):
+            job.refresh_from_db()
+            self.assertTrue(job.done)
+            self.assertIsNone(job.error)
+        runner = Runner(adaptive_session=True)
+        session = runner._session(PostponedSQL(table=PostponedSQL._meta.db_table, sql='CREATE INDEX "x" ON "t" (f)'))
+        self.assertIn('maintenance_work_mem', session)
+        self.assertIn('max_parallel_maintenance_workers', session)
+        call_command('apply_postponed', 'cleanup', '--all')
+
+    def test_017_index_type_tuning(self):
+        """Test storage parameters and finalizing steps by the index type"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            from test_explicit_index.models import ExplicitIndex1
+
+            table = ExplicitIndex1._meta.db_table
+            PostponedSQL.objects.create(
+                description='Brin', table=table, db_index='tuning_brin',
+                sql='CREATE INDEX "tuning_brin" ON "%s" USING brin ("id")' % table,
+            )
+            PostponedSQL.objects.create(
+                description='Gin', table=table, db_index='tuning_gin',
+                sql='CREATE INDEX "tuning_gin" ON "%s" USING gin ((ARRAY["id"])) WITH (fastupdate = on)' % table,
+            )
+            with override_settings(
+                POSTPONE_INDEX_INDEX_TYPE_STORAGE={
+                    'BRIN': {'pages_per_range': 16}, 'gin': {'fastupdate': 'off', 'gin_pending_list_limit': 128},
+                },
+            ):
+                with self.assertLogs('postpone_index.runner', 'INFO') as logs:
+                    call_command('apply_postponed', 'run', '-x')
+            self.assertTrue(any('brin_summarize_new_values' in r for r in logs.output))
+            self.assertTrue(any('gin_clean_pending_list' in r for r in logs.output))
+            self.assertTrue(any('USING brin ("id") WITH (pages_per_range = 16)' in r for r in logs.output))
+            self.assertTrue(any('WITH (fastupdate = on, gin_pending_list_limit = 128)' in r for r in logs.output))
+            PostponedSQL.objects.create(
+                description='Gin default', table=table, db_index='tuning_gin_default',
+                sql='CREATE INDEX "tuning_gin_default" ON "%s" USING gin ((ARRAY["id"]))' % table,
+            )
+            with self.assertLogs('postpone_index.runner', 'INFO') as logs:
+                call_command('apply_postponed', 'run', '-x')
+            self.assertTrue(any('WITH (fastupdate = off)' in r for r in logs.output))
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT relname, reloptions FROM pg_class WHERE relname LIKE 'tuning\\_%' ORDER BY relname"
+                )
+                # Storage parameters tune the build only
+                self.assertEqual(cursor.fetchall(), [
+                    ('tuning_brin', None),
+                    ('tuning_gin', ['fastupdate=on']),
+                    ('tuning_gin_default', None),
+                ])
+                cursor.execute('DROP INDEX "tuning_brin", "tuning_gin", "tuning_gin_default"')
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_018_analyze(self):
+        """Test the table is analyzed once after expression and partial index builds"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            from test_explicit_index.models import ExplicitIndex1
+
+            table = ExplicitIndex1._meta.db_table
+            call_command('apply_postponed', 'run', '-x')
+            lower = 'CREATE INDEX "analyze_lower" ON "%s" (LOWER("field1"))' % table
+            partial = 'CREATE INDEX "analyze_partial" ON "%s" ("field1") WHERE "field2" = \'x\'' % table
+            plain = 'CREATE INDEX "analyze_plain" ON "%s" ("field2")' % table
+            for analyze, sqls, count in (
+                ('none', (lower, partial), 0),
+                ('auto', (plain,), 0),
+                ('auto', (lower, plain, partial), 1),
+                ('all', (plain,), 1),
+            ):
+                for sql in sqls:
+                    PostponedSQL.objects.create(description='Analyze', table=table, sql=sql)
+                with self.assertLogs('postpone_index.runner', 'INFO') as logs:
+                    call_command('apply_postponed', 'run', '-x', '--analyze=%s' % analyze)
+                self.assertEqual(sum('SQL: ANALYZE "%s"' % table in r for r in logs.output), count)
+            with connection.cursor() as cursor:
+                cursor.execute('DROP INDEX "analyze_lower", "analyze_plain", "analyze_partial"')
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_019_existing_index(self):
+        """Test the identical valid index is not rebuilt while the invalid one is repaired in place"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            from test_explicit_index.models import ExplicitIndex1
+
+            table = ExplicitIndex1._meta.db_table
+            sql = PostponedSQL.objects.get(db_index='explicit_index1_index').sql
+            call_command('apply_postponed', 'run', '-x')
+
+            # The runner crashed after the build
+            PostponedSQL.objects.create(description='Same', table=table, db_index='explicit_index1_index', sql=sql)
+            with self.assertLogs('postpone_index.runner', 'INFO') as logs:
+                call_command('apply_postponed', 'run', '-x')
+            self.assertTrue(any('not rebuilt' in r for r in logs.output))
+            self.assertFalse(any('CREATE INDEX CONCURRENTLY' in r for r in logs.output))
+
+            # The definition is changed
+            PostponedSQL.objects.create(
+                description='Changed', table=table, db_index='explicit_index1_index',
+                sql='CREATE INDEX "explicit_index1_index" ON "%s" ("field2")' % table,
+            )
+            with self.assertLogs('postpone_index.runner', 'INFO') as logs:
+                call_command('apply_postponed', 'run', '-x')
+            self.assertTrue(any('CREATE INDEX CONCURRENTLY "explicit_index1_index"' in r for r in logs.output))
+
+            # The failed build left the invalid index
+            ExplicitIndex1.objects.create(field1='a', field2='a')
+            duplicate = ExplicitIndex1.objects.create(field1='a', field2='b')
+            with connection.cursor() as cursor:
+                with self.assertRaises(Exception):
+                    cursor.execute('CREATE UNIQUE INDEX CONCURRENTLY "existing_unique" ON "%s" ("field1")' % table)
+            duplicate.delete()
+            PostponedSQL.objects.create(
+                description='Invalid', table=table, db_index='existing_unique',
+                sql='CREATE UNIQUE INDEX "existing_unique" ON "%s" ("field1")' % table,
+            )
+            with self.assertLogs('postpone_index.runner', 'INFO') as logs:
+                call_command('apply_postponed', 'run', '-x')
+            self.assertTrue(any('REINDEX INDEX CONCURRENTLY "existing_unique"' in r for r in logs.output))
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT indisvalid FROM pg_index WHERE indexrelid = \'"existing_unique"\'::regclass')
+                self.assertTrue(cursor.fetchone()[0])
+                cursor.execute('DROP INDEX "existing_unique"')
+            ExplicitIndex1.objects.all().delete()
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_020_adopt(self):
+        """Test the equivalent index built by hand is adopted instead of building"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            from test_explicit_index.models import ExplicitIndex1
+
+            table = ExplicitIndex1._meta.db_table
+            sql = PostponedSQL.objects.get(db_index='explicit_index1_index').sql
+            with connection.cursor() as cursor:
+                cursor.execute('CREATE INDEX "dba_index" ON "%s" ("field1", "field2")' % table)
+                cursor.execute('CREATE INDEX "dba_other" ON "%s" ("field2", "field1")' % table)
+            with self.assertLogs('postpone_index.runner', 'INFO') as logs:
+                call_command('apply_postponed', 'run', '-x', '--adopt')
+            self.assertTrue(any('dba_index is adopted as explicit_index1_index' in r for r in logs.output))
+            self.assertFalse(any('CREATE INDEX CONCURRENTLY' in r for r in logs.output))
+
+            with connection.cursor() as cursor:
+                cursor.execute('DROP INDEX "explicit_index1_index"')
+                cursor.execute('CREATE INDEX "dba_index" ON "%s" ("field1", "field2")' % table)
+            PostponedSQL.objects.create(description='Again', table=table, db_index='explicit_index1_index', sql=sql)
+            with self.assertLogs('postpone_index.runner', 'INFO') as logs:
+                call_command('apply_postponed', 'run', '-x')
+            self.assertTrue(any('CREATE INDEX CONCURRENTLY' in r for r in logs.output))
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT relname FROM pg_class WHERE relname IN (%s, %s, %s) ORDER BY relname',
+                    ['dba_index', 'dba_other', 'explicit_index1_index']
+                )
+                self.assertEqual(cursor.fetchall(), [('dba_index',), ('dba_other',), ('explicit_index1_index',)])
+                cursor.execute('DROP INDEX "dba_index", "dba_other"')
+
+            # The index having the name generated by Django is never adopted
+            generated = connection.schema_editor()._create_index_name(table, ['field1'])
+            with connection.cursor() as cursor:
+                cursor.execute('CREATE INDEX "%s" ON "%s" ("field1")' % (generated, table))
+            PostponedSQL.objects.create(
+                description='Generated', table=table, db_index='adopt_generated',
+                sql='CREATE INDEX "adopt_generated" ON "%s" ("field1")' % table,
+            )
+            with self.assertLogs('postpone_index.runner', 'INFO') as logs:
+                call_command('apply_postponed', 'run', '-x', '--adopt', '--redundant=none')
+            self.assertFalse(any('is adopted' in r for r in logs.output))
+            with connection.cursor() as cursor:
+                cursor.execute('DROP INDEX "%s", "adopt_generated"' % generated)
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_021_redundant(self):
+        """Test redundant indexes covered by other jobs or existing indexes are reported, skipped or fail the run"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            from test_explicit_index.models import ExplicitIndex1
+
+            table = ExplicitIndex1._meta.db_table
+            with connection.cursor() as cursor:
+                cursor.execute('CREATE INDEX "redundant_existing" ON "%s" ("field2", "id")' % table)
+            jobs = {
+                name: PostponedSQL.objects.create(
+                    description=name, table=table, db_index=name,
+                    sql='CREATE INDEX "%s" ON "%s" %s' % (name, table, definition),
+                )
+                for name, definition in (
+                    ('redundant_prefix', '("field1")'),
+                    ('redundant_like', '("field1" varchar_pattern_ops)'),
+                    ('redundant_partial', '("field1") WHERE "field2" = \'x\''),
+                    ('redundant_existing_prefix', '("field2")'),
+                )
+            }
+            with self.assertRaises(CommandError):
+                call_command('apply_postponed', 'run', '-x', '--redundant=fail')
+            self.assertEqual(PostponedSQL.objects.filter(done=True).count(), 0)
+
+            with self.assertLogs('postpone_index.runner', 'WARNING') as logs:
+                call_command('apply_postponed', 'run', '-x', '--redundant=skip')
+            self.assertEqual(sorted(r.split(': ')[-1] for r in logs.output if 'Redundant' in r), [
+                'redundant_existing_prefix', 'redundant_prefix',
+            ])
+            for name, job in jobs.items():
+                job.refresh_from_db()
+                if name in ('redundant_prefix', 'redundant_existing_prefix'):
+                    self.assertFalse(job.done)
+                    self.assertTrue(job.error.startswith('Skipped: redundant, covered by '))
+                else:
+                    self.assertTrue(job.done)
+            with connection.cursor() as cursor:
+                cursor.execute('DROP INDEX "redundant_existing", "redundant_like", "redundant_partial"')
+            call_command('apply_postponed', 'cleanup', '--all')
+            self._assert_postponed_sql_empty()
+
+    def test_022_duplicates(self):
+        """Test duplicate keys are reported before building the unique index"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            call_command('apply_postponed', 'run', '-x')
+            from test_explicit_index.models import ExplicitIndex1
+
+            table = ExplicitIndex1._meta.db_table
+            for field1, field2 in (('a', '1'), ('a', '2'), ('a', None), ('b', '1'), ('b', '2'), ('c', '1')):
+                ExplicitIndex1.objects.create(field1=field1, field2=field2 or '')
+            job = PostponedSQL.objects.create(
+                description='Unique', table=table, db_index='duplicates_unique',
+                sql='CREATE UNIQUE INDEX "duplicates_unique" ON "%s" ("field1") WHERE "field2" <> \'\'' % table,
+            )
+            with self.assertLogs('postpone_index.runner', 'INFO') as logs:
+                call_command('apply_postponed', 'run', '--check-duplicates')
+            self.assertFalse(any('CREATE UNIQUE INDEX' in r for r in logs.output))
+            job.refresh_from_db()
+            self.assertFalse(job.done)
+            self.assertTrue(job.error.startswith('Exception: Duplicate keys ("field1") found: (a) x 2; (b) x 2'))
+            self.assertEqual(json.loads(job.duplicates), {
+                'columns': ['"field1"'],
+                'sampled': False,
+                'groups': [{'key': ['a'], 'count': 2}, {'key': ['b'], 'count': 2}],
+            })
+
+            ExplicitIndex1.objects.filter(field2='2').delete()
+            PostponedSQL.objects.filter(ts=job.ts).update(error=None)
+            call_command('apply_postponed', 'run', '-x', '--check-duplicates')
+            job.refresh_from_db()
+            self.assertTrue(job.done)
+            self.assertIsNone(job.duplicates)
+            with connection.cursor() as cursor:
+                cursor.execute('DROP INDEX "duplicates_unique"')
+            ExplicitIndex1.objects.all().delete()
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_023_disk_space(self):
+        """Test jobs not fitting the free disk space are deferred or refused"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            call_command('apply_postponed', 'run', '-x')
+            from test_explicit_index.models import ExplicitIndex1
+
+            table = ExplicitIndex1._meta.db_table
+            for i in range(100):
+                ExplicitIndex1.objects.create(field1='a%s' % i, field2='b%s' % i)
+            job = PostponedSQL.objects.create(
+                description='Disk', table=table, db_index='disk_space_index',
+                sql='CREATE INDEX "disk_space_index" ON "%s" ("field2")' % table,
+            )
+            with override_settings(
+                POSTPONE_INDEX_FREE_SPACE_SQL='SELECT 0 WHERE %s IS NOT NULL'
+            ):
+                with self.assertLogs('postpone_index.runner', 'INFO') as logs:
+                    call_command('apply_postponed', 'run', '--disk-probe', 'sql')
+                self.assertTrue(any('Deferred, needs' in r for r in logs.output))
+                self.assertTrue(any('Not enough disk space, 1 jobs left' in r for r in logs.output))
+                job.refresh_from_db()
+                self.assertFalse(job.done)
+                self.assertIsNone(job.error)
+
+                call_command('apply_postponed', 'run', '--disk-probe', 'sql', '--disk-action', 'refuse')
+                job.refresh_from_db()
+                self.assertFalse(job.done)
+                self.assertTrue(job.error.startswith('Refused: needs '))
+
+            PostponedSQL.objects.filter(ts=job.ts).update(error=None)
+            with override_settings(
+                POSTPONE_INDEX_FREE_SPACE_SQL='SELECT 1e12::bigint WHERE %s IS NOT NULL'
+            ):
+                call_command('apply_postponed', 'run', '-x', '--disk-probe', 'sql', '--disk-reserve', '1000000')
+            job.refresh_from_db()
+            self.assertTrue(job.done)
+            with connection.cursor() as cursor:
+                cursor.execute('DROP INDEX "disk_space_index"')
+            ExplicitIndex1.objects.all().delete()
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_024_lost_lease(self):
+        """Test the result is not stored by the runner which lost the lease"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            runner = Runner()
+            job = PostponedSQL.objects.filter(done=False).order_by('ts').first()
+            self.assertTrue(runner._claim(job))
+            PostponedSQL.objects.filter(ts=job.ts).update(claimed_by='other')
+            job.done = True
+            with self.assertLogs('postpone_index.runner', 'WARNING') as logs:
+                runner._release(job)
+            self.assertTrue(any('Lost the lease' in r for r in logs.output))
+            job.refresh_from_db()
+            self.assertFalse(job.done)
+            self.assertEqual(job.claimed_by, 'other')
+            PostponedSQL.objects.filter(ts=job.ts).update(claimed_by=None, lease_until=None)
+            call_command('apply_postponed', 'run', '-x')
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_025_blocker_detection_failure(self):
+        """Test the failing blocker detection does not stop the timeout enforcement"""
+        PostponedSQL.objects.using('default')._create_base_tables()
+        job = PostponedSQL.objects.create(description='Sleep', sql='SELECT pg_sleep(60)', table='sleepy')
+        with mock.patch.object(Runner, 'blocker_interval', 0.5), mock.patch.object(
+            Runner, '_blockers_of', side_effect=Exception('permission denied')
+        ):
+            with self.assertLogs('postpone_index.runner', 'ERROR') as logs:
+                call_command('apply_postponed', 'run', '--table-timeout=sleep*=3')
+        self.assertTrue(any('Blocker detection failed: permission denied' in r for r in logs.output))
+        job.refresh_from_db()
+        self.assertEqual(job.error, 'Timeout: exceeded 3 seconds')
+        call_command('apply_postponed', 'cleanup', '--all')
+
+    def test_026_retry_shared(self):
+        """Test the retry backoff and the number of attempts are shared by workers"""
+        PostponedSQL.objects.using('default')._create_base_tables()
+        job = PostponedSQL.objects.create(
+            description='Deadlock', table='deadlock',
+            sql="DO $$ BEGIN RAISE EXCEPTION 'deadlock' USING ERRCODE = '40P01'; END $$",
+        )
+        abort = threading.Event()
+
+        def apply():
+            try:
+                Runner(max_attempts=3, retry_backoff=60, abort=abort).run()
+            finally:
+                connection.close()
+
+        runner = threading.Thread(target=apply)
+        runner.start()
+        for _ in range(100):
+            if PostponedSQL.objects.filter(ts=job.ts, error__startswith='Retry').exists():
+                break
+            time.sleep(0.1)
+        abort.set()
+        runner.join()
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+        self.assertTrue(job.error.startswith('Retry 1:'))
+        self.assertGreater(job.lease_until, timezone.now() + datetime.timedelta(seconds=30))
+        self.assertFalse(Runner()._claim(job))
+
+        PostponedSQL.objects.filter(ts=job.ts).update(lease_until=None)
+        call_command('apply_postponed', 'run', '--max-attempts=3', '--retry-backoff=0.1')
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 3)
+        self.assertTrue(job.error.startswith('Exception:'))
+        call_command('apply_postponed', 'cleanup', '--all')
+
+    def test_027_exit_status(self):
+        """Test the exit status of the exhausted time budget, and runs stopped by other reasons are not reported"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            command = ApplyPostponedCommand(stdout=io.StringIO(), stderr=io.StringIO())
+            with self.assertRaises(SystemExit) as cm:
+                command.run_from_argv(['manage.py', 'apply_postponed', 'run', '--deadline=%s' % timezone.now().isoformat()])
+            self.assertEqual(cm.exception.code, 3)
+            with override_settings(
+                POSTPONE_INDEX_FREE_SPACE_SQL='SELECT 0 WHERE %s IS NOT NULL'
+            ):
+                call_command('apply_postponed', 'run', '--max-duration=3600', '--disk-probe', 'sql', '--disk-reserve', '1')
+            self.assertTrue(PostponedSQL.objects.filter(done=False).exists())
+            call_command('apply_postponed', 'run', '-x')
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_028_interrupt_status(self):
+        """Test the interrupted command exits with the status 128 + signal number"""
+        PostponedSQL.objects.using('default')._create_base_tables()
+        job = PostponedSQL.objects.create(description='Sleep', sql='SELECT pg_sleep(60)')
+        timer = threading.Timer(2, os.kill, (os.getpid(), signal.SIGINT))
+        timer.start()
+        command = ApplyPostponedCommand(stdout=io.StringIO(), stderr=io.StringIO())
+        try:
+            with self.assertRaises(SystemExit) as cm:
+                command.run_from_argv(['manage.py', 'apply_postponed', 'run'])
+        finally:
+            timer.cancel()
+        self.assertEqual(cm.exception.code, 128 + signal.SIGINT)
+        job.refresh_from_db()
+        self.assertEqual(job.error, 'Interrupted')
+        call_command('apply_postponed', 'cleanup', '--all')
+
+    def test_029_refresh(self):
+        """Test jobs postponed after the start are added to the running runner on refresh"""
+        PostponedSQL.objects.using('default')._create_base_tables()
+        first = PostponedSQL.objects.create(description='Sleep', sql='SELECT pg_sleep(2)', table='first')
+        refresh = threading.Event()
+
+        def apply():
+            try:
+                Runner(refresh=refresh).run()
+            finally:
+                connection.close()
+
+        runner = threading.Thread(target=apply)
+        runner.start()
+        time.sleep(0.5)
+        second = PostponedSQL.objects.create(description='Select', sql='SELECT 1', table='second')
+        refresh.set()
+        runner.join(30)
+        self.assertFalse(runner.is_alive())
+        for job in (first, second):
+            job.refresh_from_db()
+            self.assertTrue(job.done)
+        call_command('apply_postponed', 'cleanup', '--all')
+
+    def test_030_spawn(self):
+        """Test the spawned worker runs the management command with the settings of this process"""
+        with mock.patch('subprocess.Popen') as popen:
+            Worker.spawn('default')
+        args, kwargs = popen.call_args
+        self.assertEqual(args[0][:5], [sys.executable, '-m', 'django', 'apply_postponed', 'worker'])
+        self.assertIn('--settings', args[0])
+        result = subprocess.run(args[0] + ['--help'], env=kwargs['env'], capture_output=True, cwd='/')
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_031_statvfs_probe_unknown(self):
+        """Test the statvfs probe reports the unknown free space when the data directory is not readable"""
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE ROLE postpone_index_probe NOLOGIN')
+            try:
+                cursor.execute('SET ROLE postpone_index_probe')
+                with self.assertLogs('postpone_index.probes', 'WARNING') as logs:
+                    self.assertIsNone(StatvfsProbe(Runner()).free('pg_default'))
+                self.assertTrue(any('free space is not checked' in r for r in logs.output))
+            finally:
+                cursor.execute('RESET ROLE')
+                cursor.execute('DROP ROLE postpone_index_probe')
+
+    def test_032_worker_failed_job(self):
+        """Test the job failed by the worker is not applied again on following wakeups"""
+        PostponedSQL.objects.using('default')._create_base_tables()
+        job = PostponedSQL.objects.create(description='Division', table='division', sql='SELECT 1/0')
+        worker = Worker(poll=0.5, exit_idle=3)
+        runs = []
+        run = Runner.run
+
+        def counted(runner):
+            runs.append(runner)
+            return run(runner)
+
+        def apply():
+            try:
+                worker.run()
+            finally:
+                connection.close()
+
+        with mock.patch.object(Runner, 'run', counted):
+            thread = threading.Thread(target=apply)
+            thread.start()
+            thread.join(30)
+        self.assertFalse(thread.is_alive())
+        self.assertGreaterEqual(len(runs), 2)
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+        self.assertTrue(job.error.startswith('Exception:'))
+        call_command('apply_postponed', 'cleanup', '--all')
+
+    def test_033_worker_waits_for_migrate(self):
+        """Test the worker does not start jobs while the migrate command is running"""
+        PostponedSQL.objects.using('default')._create_base_tables()
+        job = PostponedSQL.objects.create(description='Select', table='select', sql='SELECT 1')
+        Worker.migration_started('default')
+        worker = Worker(poll=0.5)
+
+        def apply():
+            try:
+                worker.run()
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=apply)
+        thread.start()
+        try:
+            time.sleep(2)
+            job.refresh_from_db()
+            self.assertFalse(job.done)
+        finally:
+            Worker.migration_finished('default')
+        for _ in range(100):
+            job.refresh_from_db()
+            if job.done:
+                break
+            time.sleep(0.1)
+        worker.interrupted.set()
+        thread.join(30)
+        self.assertTrue(job.done)
+        call_command('apply_postponed', 'cleanup', '--all')
+
+    def test_034_post_migrate_flush(self):
+        """Test the worker is started after the migration but not after the flush"""
+        PostponedSQL.objects.using('default')._create_base_tables()
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False, POSTPONE_INDEX_POST_MIGRATE='worker'
+        ), mock.patch.object(Worker, 'spawn') as spawn:
+            call_command('migrate', self.module_name)
+            self.assertEqual(spawn.call_count, 1)
+            emit_post_migrate_signal(0, False, 'default')
+            self.assertEqual(spawn.call_count, 1)
+
+    def test_035_window_naive(self):
+        """Test maintenance windows with naive date and time when time zones are disabled"""
+        with override_settings(USE_TZ=False, TIME_ZONE='UTC'):
+            self.assertIn(timezone.now(), Window('* * * * *'))
+            self.assertIn(datetime.datetime(2026, 1, 5, 3, 0), Window('* 0-5 * * 1-5'))
+            self.assertNotIn(datetime.datetime(2026, 1, 5, 6, 0), Window('* 0-5 * * 1-5'))
+            self.assertIn(datetime.datetime(2026, 1, 5, 0, 30), Window('CRON_TZ=Asia/Tokyo * 9 * * *'))
+            self.assertNotIn(datetime.datetime(2026, 1, 5, 9, 30), Window('CRON_TZ=Asia/Tokyo * 9 * * *'))
+
+    def test_036_time_budget_naive(self):
+        """Test the time budget with and without time zones"""
+        for use_tz in (True, False):
+            with self.subTest(use_tz=use_tz), override_settings(USE_TZ=use_tz, TIME_ZONE='UTC'):
+                with override_settings(
+                    POSTPONE_INDEX_IGNORE=True
+                ):
+                    call_command('migrate', self.module_name, 'zero')
+                with override_settings(
+                    POSTPONE_INDEX_IGNORE=False
+                ):
+                    call_command('migrate', self.module_name)
+                    count = PostponedSQL.objects.filter(done=False).count()
+                    for deadline in (timezone.now().replace(tzinfo=None), datetime.datetime.now(datetime.timezone.utc)):
+                        with self.assertRaises(CommandError) as cm:
+                            call_command('apply_postponed', 'run', '-x', '--deadline=%s' % deadline.isoformat(), stdout=io.StringIO())
+                        self.assertEqual(cm.exception.returncode, 3)
+                        self.assertEqual(PostponedSQL.objects.filter(done=False).count(), count)
+                    call_command('apply_postponed', 'run', '-x', '--max-duration=3600')
+                    self.assertFalse(PostponedSQL.objects.filter(done=False).exists())
+                    call_command('apply_postponed', 'cleanup')
+                    self._assert_postponed_sql_empty()
+
+    def test_037_attempts_reset(self):
+        """Test the number of failed attempts is reset by a new run and when the job is applied"""
+        PostponedSQL.objects.using('default')._create_base_tables()
+        job = PostponedSQL.objects.create(
+            description='Division', table='division', sql='SELECT 1/0',
+            attempts=3, error='Exception: deadlock', claimed_at=timezone.now() - datetime.timedelta(days=1),
+        )
+        call_command('apply_postponed', 'run', '--max-attempts=3')
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+        self.assertTrue(job.error.startswith('Exception:'))
+        PostponedSQL.objects.filter(ts=job.ts).update(sql='SELECT 1', claimed_at=timezone.now() - datetime.timedelta(days=1))
+        call_command('apply_postponed', 'run')
+        job.refresh_from_db()
+        self.assertTrue(job.done)
+        self.assertEqual(job.attempts, 0)
+        call_command('apply_postponed', 'cleanup', '--all')
+
+    def test_038_disk_settings(self):
+        """Test the index and the sort spill are checked on tablespaces and memory of the job connection"""
+        PostponedSQL.objects.using('default')._create_base_tables()
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE "disk_settings" AS SELECT i FROM generate_series(1, 100000) i')
+            cursor.execute('ANALYZE "disk_settings"')
+        try:
+            job = PostponedSQL.objects.create(
+                description='Disk', table='disk_settings', sql='CREATE INDEX "disk_settings_index" ON "disk_settings" ("i")',
+            )
+            explicit = PostponedSQL.objects.create(
+                description='Explicit', table='disk_settings',
+                sql='CREATE INDEX "disk_settings_explicit" ON "disk_settings" ("i") TABLESPACE "pg_default"',
+            )
+            runner = Runner(disk_probe='sql')
+            self.assertEqual(runner._tablespace(job), 'pg_default')
+            index, spill = runner._space_needed(job)
+            self.assertGreater(index, 1024 * 1024)
+            self.assertEqual(spill, 0)
+
+            runner = Runner(disk_probe='sql', session={
+                'default_tablespace': 'pg_global', 'temp_tablespaces': 'pg_global', 'maintenance_work_mem': '1MB',
+            })
+            self.assertEqual(runner._tablespace(job), 'pg_global')
+            self.assertEqual(runner._tablespace(explicit), 'pg_default')
+            self.assertEqual(runner._disk_settings_of(job), ('pg_global', 'pg_global', 1024 * 1024))
+            self.assertEqual(runner._space_needed(job), (index, index))
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT current_setting('maintenance_work_mem')")
+                self.assertNotEqual(cursor.fetchone()[0], '1MB')
+
+            runner = Runner(disk_probe='sql', session={'temp_tablespaces': 'postpone_index_missing'})
+            with self.assertLogs('postpone_index.runner', 'WARNING') as logs:
+                self.assertEqual(runner._disk_settings_of(job)[1], 'pg_default')
+            self.assertTrue(any('Session settings are not applicable' in r for r in logs.output))
+
+            with override_settings(
+                POSTPONE_INDEX_FREE_SPACE_SQL="SELECT CASE WHEN %s = 'pg_global' THEN 0 ELSE 1e12::bigint END"
+            ):
+                runner = Runner(disk_probe='sql', session={'temp_tablespaces': 'pg_global', 'maintenance_work_mem': '1MB'})
+                with self.assertLogs('postpone_index.runner', 'INFO') as logs:
+                    self.assertFalse(runner._reserve(job, [job]))
+                self.assertTrue(any('Deferred, needs %s bytes on pg_global' % index in r for r in logs.output))
+                runner = Runner(disk_probe='sql', session={'temp_tablespaces': 'pg_global'})
+                self.assertTrue(runner._reserve(job, [job]))
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('DROP TABLE "disk_settings"')
+            call_command('apply_postponed', 'cleanup', '--all')
+
+    def test_039_migrate_records_migration(self):
+        """Test the plain migrate command records the migration postponing jobs"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name)
+            self.assertEqual(
+                list(PostponedSQL.objects.filter(done=False).values_list('app_label', 'migration').distinct()),
+                [(self.module_name, '0003_auto_20260130_1052')],
+            )
+            self.assertIsNone(getattr(connection, '_postpone_index_plan', None))
+            call_command('apply_postponed', 'run', '--app', 'other')
+            self.assertTrue(PostponedSQL.objects.filter(done=False).exists())
+            call_command('apply_postponed', 'run', '--app', self.module_name)
+            self.assertFalse(PostponedSQL.objects.filter(done=False).exists())
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
@@ -0,0 +1,23 @@
+import django
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('test_fields_rename', '0002_auto_20260204_0917'),
+    ]
+
+    operations = []
+
+    if django.VERSION >= (3, 0):
+        from django.contrib.postgres.operations import AddIndexConcurrently
+
+        operations += [
+            AddIndexConcurrently(
+                model_name='uniquefield1',
+                index=models.Index(fields=['renamed_field1'], name='fields_rename_concurrent'),
+            ),
+        ]
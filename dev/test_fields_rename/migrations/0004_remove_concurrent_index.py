@@ -0,0 +1,23 @@
+import django
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('test_fields_rename', '0003_concurrent_index'),
+    ]
+
+    operations = []
+
+    if django.VERSION >= (3, 0):
+        from django.contrib.postgres.operations import RemoveIndexConcurrently
+
+        operations += [
+            RemoveIndexConcurrently(
+                model_name='uniquefield1',
+                name='fields_rename_concurrent',
+            ),
+        ]
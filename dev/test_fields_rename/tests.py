@@ -1,9 +1,126 @@
 """Module Tests"""
 
+import threading
+import time
+from unittest import skipIf
+
 from config import base_tests
 
+import django
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import override_settings
+
 
 class ModuleTest(base_tests.TestCase):
     __doc__ = __doc__
 
     module_name = __name__.split('.')[0]
+
+    def test_004_migrate_lock_timeout(self):
+        """Test the immediate rename is retried under the short lock timeout"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name, '0001')
+            from test_fields_rename.models import ExplicitIndex1
+
+            started = threading.Event()
+
+            def block():
+                try:
+                    with transaction.atomic(), connection.cursor() as cursor:
+                        cursor.execute('LOCK TABLE "%s" IN ACCESS SHARE MODE' % ExplicitIndex1._meta.db_table)
+                        started.set()
+                        time.sleep(3)
+                finally:
+                    connection.close()
+
+            blocker = threading.Thread(target=block)
+            blocker.start()
+            started.wait(10)
+            with override_settings(
+                POSTPONE_INDEX_MIGRATE_LOCK_TIMEOUT=0.2,
+                POSTPONE_INDEX_MIGRATE_LOCK_RETRY_DEADLINE=30,
+            ):
+                with self.assertLogs('postpone_index.contrib.postgres.schema', 'INFO') as logs:
+                    call_command('migrate', self.module_name)
+            blocker.join()
+            self.assertTrue(any('Lock is not available' in r for r in logs.output))
+            with connection.cursor() as cursor:
+                cursor.execute('SHOW lock_timeout')
+                self.assertEqual(cursor.fetchone()[0], '0')
+            call_command('apply_postponed', 'run', '-x')
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    def test_005_migrate_lock_timeout_exceeded(self):
+        """Test the immediate rename fails when the lock is not available till the retry deadline"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name, '0001')
+            from test_fields_rename.models import ExplicitIndex1
+
+            started = threading.Event()
+            stop = threading.Event()
+
+            def block():
+                try:
+                    with transaction.atomic(), connection.cursor() as cursor:
+                        cursor.execute('LOCK TABLE "%s" IN ACCESS SHARE MODE' % ExplicitIndex1._meta.db_table)
+                        started.set()
+                        stop.wait(30)
+                finally:
+                    connection.close()
+
+            blocker = threading.Thread(target=block)
+            blocker.start()
+            started.wait(10)
+            try:
+                with override_settings(
+                    POSTPONE_INDEX_MIGRATE_LOCK_TIMEOUT=0.2,
+                    POSTPONE_INDEX_MIGRATE_LOCK_RETRY_DEADLINE=1,
+                ):
+                    with self.assertRaises(Exception):
+                        call_command('migrate', self.module_name)
+            finally:
+                stop.set()
+                blocker.join()
+            call_command('migrate', self.module_name)
+            call_command('apply_postponed', 'run', '-x')
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
+
+    @skipIf(django.VERSION < (3, 0), 'Concurrent index operations are not supported')
+    def test_006_migrate_lock_timeout_concurrently(self):
+        """Test concurrent index operations of the non-atomic migration under the short lock timeout"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False,
+            POSTPONE_INDEX_MIGRATE_LOCK_TIMEOUT=0.2,
+        ):
+            from test_fields_rename.models import UniqueField1
+
+            table = UniqueField1._meta.db_table
+            call_command('migrate', self.module_name, '0003')
+            self.assertIn('fields_rename_concurrent', connection.introspection.get_constraints(connection.cursor(), table))
+            call_command('migrate', self.module_name, '0004')
+            self.assertNotIn('fields_rename_concurrent', connection.introspection.get_constraints(connection.cursor(), table))
+            with connection.cursor() as cursor:
+                cursor.execute('SHOW lock_timeout')
+                self.assertEqual(cursor.fetchone()[0], '0')
+            call_command('apply_postponed', 'run', '-x')
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
@@ -1,9 +1,12 @@
 """Module Tests"""
 
+import threading
+import time
+
 from config import base_tests
 
 from django.core.management import call_command
-from django.db import IntegrityError
+from django.db import IntegrityError, connection, transaction
 from django.test import override_settings
 
 
@@ -70,3 +73,41 @@ class ModuleTest(base_tests.TestCase):
             call_command('apply_postponed', 'run', '-x')  # Now it should be OK
             call_command('apply_postponed', 'cleanup')
             self._assert_postponed_sql_empty()
+
+    def test_005_attach_lock_timeout(self):
+        """Test the exclusive attach step is retried under the short lock timeout"""
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=True
+        ):
+            call_command('migrate', self.module_name, 'zero')
+        with override_settings(
+            POSTPONE_INDEX_IGNORE=False
+        ):
+            call_command('migrate', self.module_name, '0001')
+            from test_unique_together.models import UniqueTogether1
+
+            started = threading.Event()
+
+            def block():
+                try:
+                    with transaction.atomic(), connection.cursor() as cursor:
+                        cursor.execute('LOCK TABLE "%s" IN ACCESS SHARE MODE' % UniqueTogether1._meta.db_table)
+                        started.set()
+                        time.sleep(3)
+                finally:
+                    connection.close()
+
+            blocker = threading.Thread(target=block)
+            blocker.start()
+            started.wait(10)
+            with self.assertLogs('postpone_index.runner', 'INFO') as logs:
+                call_command(
+                    'apply_postponed', 'run', '-x', '--lock-timeout=0.2', '--lock-retry-deadline=30',
+                    '--table=%s' % UniqueTogether1._meta.db_table,
+                )
+            blocker.join()
+            self.assertTrue(any('Lock is not available' in r for r in logs.output))
+            self.assertEqual(sum('CREATE UNIQUE INDEX CONCURRENTLY' in r for r in logs.output), 1)
+            call_command('apply_postponed', 'run', '-x')
+            call_command('apply_postponed', 'cleanup')
+            self._assert_postponed_sql_empty()
@@ -10,7 +10,7 @@ from postpone_index.models import PostponedSQL
 
 
 class PostponedSQLAdminMixin:
-    list_display = ('d', 'description', 'table', 'db_index')
+    list_display = ('d', 'description', 'table', 'db_index', 'claimed_by', 'attempts', 'duration')
     list_display_links = ('d', 'description')
     search_fields = ('description', 'table', 'db_index')
     list_filter = (
@@ -0,0 +1,71 @@
+"""
+Admission controller holding new postponed jobs back while the database is loaded.
+"""
+import time
+
+from django.db import connections
+
+
+class Admission:
+    """
+    Samples the database load and reports reasons to wait before starting new jobs.
+
+    The replication replay lag is taken from the `pg_stat_replication`,
+    the number of active backends from the `pg_stat_activity` excluding backends running jobs,
+    and the WAL generation rate from the difference of WAL positions between samples.
+    """
+    sample_interval = 5.0
+
+    def __init__(self, database, max_replication_lag=None, max_active_backends=None, max_wal_rate=None):
+        self.database = database
+        self.max_replication_lag = max_replication_lag
+        self.max_active_backends = max_active_backends
+        self.max_wal_rate = max_wal_rate
+        self._sampled = None
+        self._wal = None
+        self._reasons = []
+
+    def __bool__(self):
+        return any(v is not None for v in (self.max_replication_lag, self.max_active_backends, self.max_wal_rate))
+
+    def reasons(self, pids=()):
+        """Reasons to wait, sampled not more often than the sample interval"""
+        now = time.monotonic()
+        if self._sampled is not None and now - self._sampled < self.sample_interval:
+            return self._reasons
+        if self._wal is None and self.max_wal_rate is not None:
+            # The initial WAL rate needs two samples
+            self._sampled, (_, _, self._wal) = now, self._sample(pids)
+            time.sleep(1.0)
+            now = time.monotonic()
+        lag, active, wal = self._sample(pids)
+        reasons = []
+        if self.max_replication_lag is not None and lag > self.max_replication_lag:
+            reasons.append('replication lag %.1f s > %s s' % (lag, self.max_replication_lag))
+        if self.max_active_backends is not None and active > self.max_active_backends:
+            reasons.append('active backends %s > %s' % (active, self.max_active_backends))
+        if self.max_wal_rate is not None:
+            rate = float(wal - self._wal) / (now - self._sampled)
+            if rate > self.max_wal_rate:
+                reasons.append('WAL rate %.0f B/s > %s B/s' % (rate, self.max_wal_rate))
+        self._sampled = now
+        self._wal = wal
+        self._reasons = reasons
+        return reasons
+
+    def _sample(self, pids):
+        """Sample the replication lag, active backends and the WAL position"""
+        with connections[self.database].cursor() as cursor:
+            cursor.execute(
+                """
+                    SELECT
+                        (SELECT COALESCE(max(EXTRACT(EPOCH FROM replay_lag)), 0) FROM pg_stat_replication),
+                        (
+                            SELECT count(*) FROM pg_stat_activity
+                            WHERE state = 'active' AND backend_type = 'client backend'
+                            AND pid <> pg_backend_pid() AND NOT pid = ANY(%s::int[])
+                        ),
+                        pg_wal_lsn_diff(pg_current_wal_lsn(), '0/0')
+                """, [list(pids)]
+            )
+            return cursor.fetchone()
@@ -1,8 +1,47 @@
 """App config"""
 from django.apps import AppConfig
+from django.conf import settings
+from django.db import connections
+from django.db.models.signals import post_migrate, pre_migrate
 from django.utils.translation import gettext_lazy as _
 
 
 class Config(AppConfig):
     verbose_name = _('Postpone Index')
     name = 'postpone_index'
+
+    def ready(self):
+        """Connect signal handlers"""
+        pre_migrate.connect(self._pre_migrate, sender=self, dispatch_uid='postpone_index_pre_migrate')
+        post_migrate.connect(self._post_migrate, sender=self, dispatch_uid='postpone_index_post_migrate')
+
+    def _pre_migrate(self, using='default', **kw):
+        """Hold workers back while migrating, store the plan to record migrations postponing jobs"""
+        # Avoid importing models before apps are ready
+        from postpone_index.runner import Worker
+
+        connections[using]._postpone_index_plan = kw.get('plan')
+        Worker.migration_started(using)
+
+    def _post_migrate(self, using='default', **kw):
+        """Wake or start the worker applying jobs after the migration"""
+        if kw.get('plan') is None:
+            # Sent by the flush command, not by the migration
+            return
+        # Avoid importing models before apps are ready
+        from postpone_index.models import PostponedSQL
+        from postpone_index.runner import Worker
+
+        connections[using]._postpone_index_plan = None
+        Worker.migration_finished(using)
+        mode = getattr(settings, 'POSTPONE_INDEX_POST_MIGRATE', None)
+        if not mode or getattr(settings, 'POSTPONE_INDEX_IGNORE', False):
+            return
+
+        if not PostponedSQL.objects.using(using)._is_present():
+            return
+        match mode:
+            case 'notify':
+                Worker.wake(using)
+            case 'worker':
+                Worker.spawn(using)
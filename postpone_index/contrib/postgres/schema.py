@@ -2,11 +2,15 @@
 import logging
 import os
 import os.path
+import random
+import time
 
 from django.conf import settings
+from django.db import OperationalError, transaction
 from django.db.backends.postgresql.schema import (
     DatabaseSchemaEditor as _DatabaseSchemaEditor,
 )
+from django.db.migrations.recorder import MigrationRecorder
 
 from postpone_index.utils import Utils
 
@@ -18,6 +22,7 @@ package_folder = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 class DatabaseSchemaEditorMixin(Utils):
     """Mixin to embed into DatabaseSchemaEditor"""
     _base_tables_created = False
+    lock_retry_delay_max = 30.0
 
     def _create_base_tables(self):
         """
@@ -35,6 +40,76 @@ class DatabaseSchemaEditorMixin(Utils):
         """Check whether to ignore the extension"""
         return getattr(settings, 'POSTPONE_INDEX_IGNORE', False) or getattr(self, '_postpone_index_ignore', False)
 
+    def _migration(self):
+        """
+        Application label and name of the migration being applied if known.
+
+        The `migrate_postponed` command tracks the migration being applied, otherwise it is the first migration
+        of the plan of the `migrate` command not yet applied, or not yet unapplied, by the migration recorder.
+        """
+        if migration := getattr(self.connection, '_postpone_index_migration', None):
+            return migration
+        plan = getattr(self.connection, '_postpone_index_plan', None)
+        if not plan:
+            return None, None
+        applied = MigrationRecorder(self.connection).applied_migrations()
+        for migration, backwards in plan:
+            # Squashed migrations are recorded as replaced ones
+            keys = migration.replaces or [(migration.app_label, migration.name)]
+            if all(k in applied for k in keys) == backwards:
+                return migration.app_label, migration.name
+        return None, None
+
+    def _execute_immediate(self, sql, params=()):
+        """
+        Execute the statement passed through immediately.
+
+        When the `POSTPONE_INDEX_MIGRATE_LOCK_TIMEOUT` is set, the statement is executed
+        under this lock timeout, and retried with jittered delays until
+        the `POSTPONE_INDEX_MIGRATE_LOCK_RETRY_DEADLINE` instead of queueing behind long queries.
+        The savepoint is used inside the transaction, while statements which can not run
+        in the transaction block like `CREATE INDEX CONCURRENTLY` and non-atomic migrations
+        set the lock timeout for the session.
+        """
+        lock_timeout = getattr(settings, 'POSTPONE_INDEX_MIGRATE_LOCK_TIMEOUT', None)
+        if not lock_timeout or self.collect_sql:
+            return super().execute(sql, params)
+        atomic = self.connection.in_atomic_block
+        if atomic and self._non_transactional_re.match(str(sql)):
+            # Fails in the transaction block anyway, can not be retried
+            return super().execute(sql, params)
+        retry_deadline = getattr(settings, 'POSTPONE_INDEX_MIGRATE_LOCK_RETRY_DEADLINE', None)
+        if retry_deadline is None:
+            retry_deadline = 300.0
+        deadline = time.monotonic() + retry_deadline
+        attempt = 0
+        while True:
+            try:
+                if not atomic:
+                    with self.connection.cursor() as cursor:
+                        cursor.execute("SET lock_timeout = '%dms'" % (lock_timeout * 1000))
+                        try:
+                            return super().execute(sql, params)
+                        finally:
+                            cursor.execute('RESET lock_timeout')
+                with transaction.atomic(using=self.connection.alias, savepoint=True):
+                    with self.connection.cursor() as cursor:
+                        # Keep the lock timeout of the outer transaction for other statements
+                        cursor.execute('SHOW lock_timeout')
+                        original = cursor.fetchone()[0]
+                        cursor.execute("SET LOCAL lock_timeout = '%dms'" % (lock_timeout * 1000))
+                        ret = super().execute(sql, params)
+                        cursor.execute("SELECT set_config('lock_timeout', %s, true)", [original])
+                return ret
+            except OperationalError as ex:
+                if self._sqlstate(ex) != '55P03' or time.monotonic() >= deadline:
+                    raise
+                delay = random.uniform(0, min(lock_timeout * 2 ** attempt, self.lock_retry_delay_max))
+                delay = min(delay, max(0, deadline - time.monotonic()))
+                logger.info('[%s] Lock is not available, retry in %.1f seconds: %s', self.connection.alias, delay, sql)
+                time.sleep(delay)
+                attempt += 1
+
     def execute(self, sql, params=()):
         """
         Overriden for execute processing with special handling for index operations.
@@ -61,12 +136,15 @@ class DatabaseSchemaEditorMixin(Utils):
                 table_name,
                 columns
             )
+            app_label, migration = self._migration()
             PostponedSQL.objects.using(self.connection.alias).create(
                 sql=str(sql),
                 description=description,
                 table=table_name,
                 db_index=index_name,
-                fields=columns
+                fields=columns,
+                app_label=app_label,
+                migration=migration
             )
             logger.info('[%s] Postponed %s', self.connection.alias, description)
         elif match := self._add_constraint_re.fullmatch(str(sql)):
@@ -79,12 +157,15 @@ class DatabaseSchemaEditorMixin(Utils):
                 table_name,
                 columns,
             )
+            app_label, migration = self._migration()
             PostponedSQL.objects.using(self.connection.alias).create(
                 sql=str(sql),
                 description=description,
                 table=table_name,
                 db_index=index_name,
-                fields=columns
+                fields=columns,
+                app_label=app_label,
+                migration=migration
             )
             logger.info('[%s] Postponed %s', self.connection.alias, description)
         else:
@@ -95,9 +176,12 @@ class DatabaseSchemaEditorMixin(Utils):
                     logger.info('[%s] Removed Index %s from postponed', self.connection.alias, index_name)
                 # Avoid errors on introspecting inexistent index
                 try:
-                    return super().execute(sql, params)
+                    return self._execute_immediate(sql, params)
                     logger.info('[%s] Drop index %s success', self.connection.alias, index_name)
                 except Exception as ex:
+                    if self._sqlstate(ex) != '42704':
+                        # Only the inexistent index is ignored, f.e. the lock wait is out of the retry deadline
+                        raise
                     logger.info('[%s] Drop index %s ignored: %s', self.connection.alias, index_name, ex)
             elif match := self._drop_constraint_re.fullmatch(str(sql)):
                 # Override to ignore inexistent constraint drop error
@@ -107,16 +191,19 @@ class DatabaseSchemaEditorMixin(Utils):
                     logger.info('[%s] Removed Constraint %s on %s from postponed', self.connection.alias, index_name, table_name)
                 # Avoid errors on introspecting inexistent constraint
                 try:
-                    return super().execute(sql, params)
+                    return self._execute_immediate(sql, params)
                     logger.info('[%s] Drop constraint %s success', self.connection.alias, index_name)
                 except Exception as ex:
+                    if self._sqlstate(ex) != '42704':
+                        # Only the inexistent constraint is ignored, f.e. the lock wait is out of the retry deadline
+                        raise
                     logger.info('[%s] Drop constraint %s ignored: %s', self.connection.alias, index_name, ex)
             elif match := self._drop_table_re.fullmatch(str(sql)):
                 # Table dropped cancels all postponed operations related
                 table_name = match.group('table_nameq') or match.group('table_name')
                 if PostponedSQL.objects.using(self.connection.alias).filter(table=table_name, done=False).delete()[0]:
                     logger.info('[%s] Removed all indexes on table %s from postponed', self.connection.alias, table_name)
-                return super().execute(sql, params)
+                return self._execute_immediate(sql, params)
             elif match := self._drop_column_re.fullmatch(str(sql)):
                 # Column dropped cancels all postponed operations related
                 table_name = match.group('table_nameq') or match.group('table_name')
@@ -128,7 +215,7 @@ class DatabaseSchemaEditorMixin(Utils):
                         '[%s] Removed all indexes on column %s of table %s from postponed',
                         self.connection.alias, column_name, table_name
                     )
-                return super().execute(sql, params)
+                return self._execute_immediate(sql, params)
             elif match := self._rename_column_re.fullmatch(str(sql)):
                 # Rename column changes the postponed indexes to alter SQL but not the index name
                 table_name = match.group('table_nameq') or match.group('table_name')
@@ -144,7 +231,7 @@ class DatabaseSchemaEditorMixin(Utils):
                     postponed_sql.sql = postponed_sql.sql.replace('"%s"' % column_name, '"%s"' % ncolumn_name)
                     postponed_sql.fields = postponed_sql.fields.replace('"%s"' % column_name, '"%s"' % ncolumn_name)
                     postponed_sql.save(update_fields=['sql', 'fields'])
-                return super().execute(sql, params)
+                return self._execute_immediate(sql, params)
             elif match := self._rename_table_re.fullmatch(str(sql)):
                 # Rename table changes the postponed indexes to alter SQL and table name but not anything other
                 table_name = match.group('table_nameq') or match.group('table_name')
@@ -159,10 +246,10 @@ class DatabaseSchemaEditorMixin(Utils):
                     postponed_sql.sql = postponed_sql.sql.replace('"%s"' % table_name, '"%s"' % ntable_name)
                     postponed_sql.table = ntable_name
                     postponed_sql.save(update_fields=['sql', 'table'])
-                return super().execute(sql, params)
+                return self._execute_immediate(sql, params)
             else:
                 logger.debug('[%s] No special statements: %s', self.connection.alias, sql)
-                return super().execute(sql, params)
+                return self._execute_immediate(sql, params)
 
     def _alter_field(
         self, model, old_field, new_field, old_type, new_type,
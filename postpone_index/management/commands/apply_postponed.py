@@ -6,20 +6,26 @@ import argparse
 import logging
 import sys
 
-from django.core.management.base import BaseCommand
-from django.db import connections
+from django.core.management.base import BaseCommand, CommandError
 
+from postpone_index.management.utils import (
+    RunArgumentsMixin,
+    StatusCommandError,
+)
 from postpone_index.models import PostponedSQL
+from postpone_index.runner import ClusterRunner, RedundantIndexes, Worker
 from postpone_index.utils import ObjMap, Utils
 
 
 logger = logging.getLogger(__name__)
 
 
-class Command(Utils, BaseCommand):
+class Command(RunArgumentsMixin, Utils, BaseCommand):
     __doc__ = __doc__
     help = __doc__
 
+    budget_exhausted_status = 3
+
     _short_format = '%(d)s %(sql)s'
     _descr_format = '%(i)04d: %(d)s %(description)s'
     _long_format = '%(i)04d: %(d)s %(sql)s'
@@ -88,11 +94,79 @@ Additional names are:
             help='Immediately stop on any exception. Continues with the next job by default'
         )
         run.add_argument(
+            '-db', '--database',
+            dest='databases',
+            action='append',
+            default=None,
+            help='Database alias to be applied, may be repeated, default is default'
+        )
+        run.add_argument(
+            '--all-databases',
+            dest='all_databases',
+            action='store_true',
+            help='Apply all PostgreSQL database aliases where the postponed jobs storage is present'
+        )
+        run.add_argument(
+            '--database-jobs',
+            dest='database_jobs',
+            type=self._name_value(int),
+            action='append',
+            default=None,
+            metavar='DATABASE=N',
+            help='Number of jobs applied in parallel on the database alias instead of --jobs, may be repeated'
+        )
+        run.add_argument(
+            '--cluster-jobs',
+            dest='cluster_jobs',
+            type=int,
+            default=None,
+            help='Limit total number of jobs applied in parallel on all database aliases, POSTPONE_INDEX_CLUSTER_JOBS setting by default'
+        )
+        run.add_argument(
+            '--max-duration',
+            dest='max_duration',
+            type=int,
+            default=None,
+            metavar='SECONDS',
+            help='Start only jobs expected to finish in this time, exit with the status 3 if any job is left'
+        )
+        run.add_argument(
+            '--deadline',
+            dest='deadline',
+            type=self._datetime,
+            default=None,
+            metavar='DATETIME',
+            help='Start only jobs expected to finish before this ISO 8601 date and time, exit with the status 3 if any job is left'
+        )
+        self._add_run_arguments(run)
+        worker = subparsers.add_parser(
+            name='worker',
+            formatter_class=self.formatter_class,
+            help='Apply postponed index creation jobs as soon as they are postponed, listening for notifications'
+        )
+        worker.add_argument(
             '-db', '--database',
             dest='database',
             default='default',
             help='Database alias to be applied, default is %(default)s'
         )
+        worker.add_argument(
+            '--poll',
+            dest='poll',
+            type=int,
+            default=None,
+            metavar='SECONDS',
+            help='Check for jobs at least once per this time, POSTPONE_INDEX_WORKER_POLL setting or 60 by default'
+        )
+        worker.add_argument(
+            '--exit-idle',
+            dest='exit_idle',
+            type=int,
+            default=None,
+            metavar='SECONDS',
+            help='Exit when no jobs postponed for this time, POSTPONE_INDEX_WORKER_EXIT_IDLE setting or never by default'
+        )
+        self._add_run_arguments(worker)
         cleanup = subparsers.add_parser(
             name='cleanup',
             formatter_class=self.formatter_class,
@@ -115,6 +189,12 @@ Additional names are:
         """Handling commands"""
         if not options['command']:
             return self.print_help(sys.argv[0], sys.argv[1])
+        self._normalize_run_options(options)
+        if options.get('database'):
+            queryset = PostponedSQL.objects.using(options['database'])
+            if queryset._is_present():
+                # Upgrade the storage created by the previous package version
+                queryset._create_base_tables()
         return getattr(self, '_handle_%s' % options['command'])(*args, **options)
 
     def _handle_list(self, *args, **options):
@@ -147,25 +227,27 @@ Additional names are:
 
     def _handle_run(self, *args, **options):
         """Handle run command"""
-        try:
-            PostponedSQL.objects.using(options['database']).all().first()
-        except Exception:
-            # The table has not been created
-            return
-        q = PostponedSQL.objects.using(options['database']).filter(done=False).order_by('ts')
-        for j in q:
+        runner = ClusterRunner(**options)
+        with self._interruptible(runner.interrupted):
             try:
-                j.error = None
-                j.done = False
-                self._handle_run_job(j, *args, **options)
-                j.save(update_fields=['error', 'done'])
-            except Exception as ex:
-                logger.warning('Error on running job: %s', ex)
-                if not j.error:
-                    j.error = 'Exception: %s' % ex
-                j.save(update_fields=['error', 'done'])
-                if options['exception']:
-                    raise
+                left = runner.run()
+            except RedundantIndexes as ex:
+                raise CommandError(ex)
+        if not left:
+            return
+        for database, jobs in left.items():
+            self.stdout.write('[%s] %s jobs left, estimated %.0f seconds:' % (
+                database, len(jobs), sum(estimate or 0 for _, estimate in jobs)
+            ))
+            for job, estimate in jobs:
+                self.stdout.write('    %s (%.0f seconds)' % (job.description, estimate or 0))
+        raise StatusCommandError('The time budget is exhausted', self.budget_exhausted_status)
+
+    def _handle_worker(self, *args, **options):
+        """Handle worker command"""
+        worker = Worker(**options)
+        with self._interruptible(worker.interrupted):
+            worker.run()
 
     def _handle_cleanup(self, *args, **options):
         """Handle cleanup command"""
@@ -178,74 +260,3 @@ Additional names are:
         if not options['all']:
             q = q.filter(done=True)
         q.delete()
-
-    def _handle_run_job(self, job, *args, **options):
-        """Handle a single job for the run command"""
-        if match := self._create_index_re.fullmatch(job.sql):
-            unique = match.group('unique') or ''
-            index_name = match.group('index_nameq') or match.group('index_name')
-            table_name = match.group('table_nameq') or match.group('table_name')
-            rest = match.group('rest')
-            sql = 'DROP INDEX IF EXISTS "%s"' % (
-                index_name,
-            )
-            logger.info('[%s] SQL: %s', options['database'], sql)
-            cursor = connections[options['database']].cursor()
-            cursor.execute(sql)
-            cursor.close()
-            sql = 'CREATE %sINDEX CONCURRENTLY "%s" ON "%s" %s' % (
-                unique,
-                index_name,
-                table_name,
-                rest
-            )
-            logger.info('[%s] SQL: %s', options['database'], sql)
-            cursor = connections[options['database']].cursor()
-            cursor.execute(sql)
-            cursor.close()
-        elif match := self._add_constraint_re.fullmatch(job.sql):
-            unique = 'UNIQUE '
-            index_name = match.group('index_nameq') or match.group('index_name')
-            table_name = match.group('table_nameq') or match.group('table_name')
-            rest = match.group('rest')
-            sql = 'ALTER TABLE "%s" DROP CONSTRAINT IF EXISTS "%s"' % (
-                table_name,
-                index_name,
-            )
-            logger.info('[%s] SQL: %s', options['database'], sql)
-            cursor = connections[options['database']].cursor()
-            cursor.execute(sql)
-            cursor.close()
-            sql = 'DROP INDEX IF EXISTS "%s"' % (
-                index_name,
-            )
-            logger.info('[%s] SQL: %s', options['database'], sql)
-            cursor = connections[options['database']].cursor()
-            cursor.execute(sql)
-            cursor.close()
-            sql = 'CREATE %sINDEX CONCURRENTLY "%s" ON "%s" %s' % (
-                unique,
-                index_name,
-                table_name,
-                rest
-            )
-            logger.info('[%s] SQL: %s', options['database'], sql)
-            cursor = connections[options['database']].cursor()
-            cursor.execute(sql)
-            cursor.close()
-            sql = 'ALTER TABLE "%s" ADD CONSTRAINT "%s" UNIQUE USING INDEX "%s"' % (
-                table_name,
-                index_name,
-                index_name,
-            )
-            logger.info('[%s] SQL: %s', options['database'], sql)
-            cursor = connections[options['database']].cursor()
-            cursor.execute(sql)
-            cursor.close()
-        else:
-            logger.info('[%s] Unrecognized: %s', options['database'], sql)
-            cursor = connections[options['database']].cursor()
-            cursor.execute(sql)
-            cursor.close()
-        job.error = None
-        job.done = True
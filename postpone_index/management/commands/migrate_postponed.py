@@ -0,0 +1,200 @@
+"""
+The migrate_postponed command migrates the database like the migrate command,
+and applies postponed index and constraint creation in CONCURRENTLY manner
+as soon as the migration postponing them has been committed.
+"""
+import logging
+import threading
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.core.management.commands.migrate import Command as MigrateCommand
+from django.db import connections
+from django.db.migrations.operations import RunPython, SeparateDatabaseAndState
+from django.db.migrations.operations.models import (
+    CreateModel,
+    ModelOperation,
+    RenameModel,
+)
+from django.db.models.signals import pre_migrate
+
+from postpone_index.management.utils import RunArgumentsMixin
+from postpone_index.models import PostponedSQL
+from postpone_index.runner import Runner
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(RunArgumentsMixin, MigrateCommand):
+    __doc__ = __doc__
+    help = __doc__
+
+    poll_interval = 5.0
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        self._add_run_arguments(parser)
+
+    def handle(self, *args, **options):
+        """Migrate applying postponed jobs concurrently"""
+        self._normalize_run_options(options)
+        if getattr(settings, 'POSTPONE_INDEX_IGNORE', False) or options.get('plan') or options.get('check_unapplied'):
+            return super().handle(*args, **options)
+
+        self._database = options['database']
+        self._lock = threading.Lock()
+        self._remaining = {}
+        self._committed = set()
+        self._blocked = None
+        self._progress = threading.Event()
+        self._finished = threading.Event()
+        self._interrupted = threading.Event()
+        with connections[self._database].cursor() as cursor:
+            cursor.execute('SELECT now()')
+            started = cursor.fetchone()[0]
+
+        stream = threading.Thread(
+            target=self._stream, args=(started, options), name='postpone_index_stream', daemon=True
+        )
+        pre_migrate.connect(self._pre_migrate, dispatch_uid='postpone_index_migrate_postponed')
+        stream.start()
+        try:
+            super().handle(*args, **options)
+        except KeyboardInterrupt:
+            # Running jobs are cancelled to be applied again later
+            self._interrupted.set()
+            raise
+        finally:
+            pre_migrate.disconnect(dispatch_uid='postpone_index_migrate_postponed')
+            connections[self._database]._postpone_index_migration = None
+            # The streaming runner stops starting new jobs, the final runner applies the rest
+            self._finished.set()
+            self._progress.set()
+            stream.join()
+
+        if PostponedSQL.objects.using(self._database)._is_present():
+            # Jobs failed while streaming are not retried
+            runner = Runner(started=started, **options)
+            with self._interruptible(runner.interrupted):
+                runner.run()
+
+    def _pre_migrate(self, plan=None, using=None, **kw):
+        """Store the migration plan"""
+        if using != self._database or plan is None:
+            return
+        with self._lock:
+            self._remaining = {
+                (migration.app_label, migration.name): self._tables(migration)
+                for migration, backwards in plan
+            }
+            self._update_blocked()
+
+    def migration_progress_callback(self, action, migration=None, fake=False):
+        """Track the migration being applied and committed migrations"""
+        super().migration_progress_callback(action, migration, fake)
+        connection = connections[self._database] if hasattr(self, '_database') else None
+        if connection is None:
+            return
+        if action in ('apply_start', 'unapply_start'):
+            connection._postpone_index_migration = (migration.app_label, migration.name)
+        elif action in ('apply_success', 'unapply_success'):
+            connection._postpone_index_migration = None
+            with self._lock:
+                self._committed.add((migration.app_label, migration.name))
+                self._remaining.pop((migration.app_label, migration.name), None)
+                self._update_blocked()
+            self._progress.set()
+
+    def _update_blocked(self):
+        """Update tables touched by not yet committed migrations, None if unknown"""
+        blocked = set()
+        for tables in self._remaining.values():
+            if tables is None:
+                blocked = None
+                break
+            blocked |= tables
+        self._blocked = blocked
+
+    def _eligible(self, job):
+        """Check whether the job may be applied while migrating"""
+        with self._lock:
+            if job.migration and (job.app_label, job.migration) not in self._committed:
+                return False
+            return self._blocked is not None and job.table not in self._blocked
+
+    def _stream(self, started, options):
+        """
+        Apply eligible jobs every time when the migration has been committed.
+
+        The running streaming runner adds jobs of migrations committed later,
+        and stops starting new jobs when the migration is finished.
+        """
+        try:
+            while not self._finished.is_set():
+                self._progress.wait(self.poll_interval)
+                self._progress.clear()
+                if self._finished.is_set():
+                    break
+                queryset = PostponedSQL.objects.using(self._database)
+                if not (queryset._is_present() and queryset._is_actual()):
+                    continue
+                Runner(
+                    started=started, eligible=self._eligible, refresh=self._progress,
+                    abort=self._finished, interrupted=self._interrupted, **options
+                ).run()
+        except Exception as ex:
+            logger.warning('[%s] Error on streaming jobs: %s', self._database, ex)
+        finally:
+            connections[self._database].close()
+
+    @classmethod
+    def _operations(cls, operations):
+        """Database operations of the migration"""
+        for operation in operations:
+            if isinstance(operation, SeparateDatabaseAndState):
+                yield from cls._operations(operation.database_operations)
+            else:
+                yield operation
+
+    @classmethod
+    def _tables(cls, migration):
+        """Tables touched by the migration, None if unknown"""
+        tables = set()
+        for operation in cls._operations(migration.operations):
+            if isinstance(operation, RunPython):
+                # Data migration doesn't conflict with concurrent index creation
+                continue
+            if isinstance(operation, RenameModel):
+                tables.add(cls._table(migration.app_label, operation.old_name))
+                tables.add(cls._table(migration.app_label, operation.new_name))
+            elif isinstance(operation, CreateModel):
+                tables.add(operation.options.get('db_table') or cls._table(migration.app_label, operation.name))
+            elif isinstance(operation, ModelOperation):
+                tables.add(cls._table(migration.app_label, operation.name))
+            elif model_name := getattr(operation, 'model_name', None):
+                tables.add(cls._table(migration.app_label, model_name))
+            else:
+                # Raw SQL or unknown operation may touch any table
+                return None
+            if db_table := getattr(operation, 'table', None):
+                tables.add(db_table)
+            fields = [f for _, f in getattr(operation, 'fields', [])] + [getattr(operation, 'field', None)]
+            for field in fields:
+                remote_field = getattr(field, 'remote_field', None)
+                if remote_field and remote_field.model != 'self':
+                    # Foreign key constraint locks the referenced table
+                    tables.add(cls._table(migration.app_label, remote_field.model))
+        return tables
+
+    @staticmethod
+    def _table(app_label, model):
+        """Table of the model referenced in the migration"""
+        if not isinstance(model, str):
+            return model._meta.db_table
+        if '.' in model:
+            app_label, model = model.split('.', 1)
+        try:
+            return global_apps.get_model(app_label, model)._meta.db_table
+        except LookupError:
+            return '%s_%s' % (app_label, model.lower())
@@ -0,0 +1,375 @@
+"""Utilities for management commands"""
+import argparse
+import logging
+import signal
+import sys
+import threading
+from contextlib import contextmanager
+
+import django
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+logger = logging.getLogger(__name__)
+
+
+class StatusCommandError(CommandError):
+    """Command error exiting with the status, the `returncode` of the `CommandError` exists since Django 3.1"""
+
+    def __init__(self, message, returncode):
+        super().__init__(message)
+        self.returncode = returncode
+
+
+class RunArgumentsMixin:
+    """Command mixin adding arguments of commands applying jobs"""
+
+    def execute(self, *args, **options):
+        """Overriden to exit with the status of the `StatusCommandError` on Django before 3.1"""
+        try:
+            return super().execute(*args, **options)
+        except StatusCommandError as ex:
+            if django.VERSION >= (3, 1) or not getattr(self, '_called_from_command_line', False):
+                raise
+            self.stderr.write('%s: %s' % (ex.__class__.__name__, ex))
+            sys.exit(ex.returncode)
+
+    def _add_run_arguments(self, parser):
+        """Add arguments common for commands applying jobs"""
+        parser.add_argument(
+            '-j', '--jobs',
+            dest='jobs',
+            type=int,
+            default=None,
+            help='Number of jobs applied in parallel on different tables, POSTPONE_INDEX_JOBS setting or 1 by default'
+        )
+        parser.add_argument(
+            '--tablespace-jobs',
+            dest='tablespace_jobs',
+            type=self._name_value(int),
+            action='append',
+            default=None,
+            metavar='TABLESPACE=N',
+            help='Limit number of jobs applied in parallel on the tablespace, may be repeated'
+        )
+        parser.add_argument(
+            '--lease',
+            dest='lease',
+            type=int,
+            default=None,
+            metavar='SECONDS',
+            help='Lease time of the claimed job prolonged while applying, POSTPONE_INDEX_LEASE setting or 120 by default'
+        )
+        parser.add_argument(
+            '--policy',
+            dest='policy',
+            default=None,
+            help='Scheduling policy, either `ts`, `sjf`, `priority`, `locality`, or the dotted path to the policy class, '
+            'POSTPONE_INDEX_POLICY setting or `ts` by default'
+        )
+        parser.add_argument(
+            '--priority',
+            dest='priorities',
+            type=self._name_value(int),
+            action='append',
+            default=None,
+            metavar='PATTERN=N',
+            help='Priority of jobs on indexes or tables matching the glob pattern used by the `priority` policy, may be repeated'
+        )
+        parser.add_argument(
+            '--table',
+            dest='tables',
+            action='append',
+            default=None,
+            metavar='PATTERN',
+            help='Apply only jobs on tables matching the glob pattern, may be repeated'
+        )
+        parser.add_argument(
+            '--index',
+            dest='indexes',
+            action='append',
+            default=None,
+            metavar='PATTERN',
+            help='Apply only jobs on indexes matching the glob pattern, may be repeated'
+        )
+        parser.add_argument(
+            '--app',
+            dest='apps',
+            action='append',
+            default=None,
+            metavar='PATTERN',
+            help='Apply only jobs postponed by migrations of applications matching the glob pattern, may be repeated'
+        )
+
+        parser.add_argument(
+            '--window',
+            dest='windows',
+            action='append',
+            default=None,
+            metavar='CRON',
+            help='Cron-like expression matching minutes of the maintenance window where jobs are started, may be repeated, '
+            'POSTPONE_INDEX_WINDOWS setting or always by default'
+        )
+        parser.add_argument(
+            '--window-cancel',
+            dest='window_cancel',
+            action='store_true',
+            default=None,
+            help='Cancel running jobs when the maintenance window is closed, POSTPONE_INDEX_WINDOW_CANCEL setting by default'
+        )
+        parser.add_argument(
+            '--max-replication-lag',
+            dest='max_replication_lag',
+            type=float,
+            default=None,
+            metavar='SECONDS',
+            help='Hold new jobs back while the replication replay lag exceeds this time, '
+            'POSTPONE_INDEX_MAX_REPLICATION_LAG setting by default'
+        )
+        parser.add_argument(
+            '--max-active-backends',
+            dest='max_active_backends',
+            type=int,
+            default=None,
+            metavar='N',
+            help='Hold new jobs back while the number of other active backends exceeds this number, '
+            'POSTPONE_INDEX_MAX_ACTIVE_BACKENDS setting by default'
+        )
+        parser.add_argument(
+            '--max-wal-rate',
+            dest='max_wal_rate',
+            type=int,
+            default=None,
+            metavar='BYTES',
+            help='Hold new jobs back while the WAL generation rate per second exceeds this number, '
+            'POSTPONE_INDEX_MAX_WAL_RATE setting by default'
+        )
+        parser.add_argument(
+            '--replica-wait',
+            dest='replica_wait',
+            type=float,
+            default=None,
+            metavar='SECONDS',
+            help='Wait up to this time until replicas have replayed the applied job before it is marked done, '
+            'POSTPONE_INDEX_REPLICA_WAIT setting or no wait by default'
+        )
+        parser.add_argument(
+            '--replica',
+            dest='replicas',
+            action='append',
+            default=None,
+            metavar='APPLICATION_NAME',
+            help='Wait for the replica having this application name, may be repeated, '
+            'POSTPONE_INDEX_REPLICAS setting or all connected replicas by default'
+        )
+        parser.add_argument(
+            '--timeout',
+            dest='timeout',
+            type=float,
+            default=None,
+            metavar='SECONDS',
+            help='Cancel the job running longer than this time, POSTPONE_INDEX_TIMEOUT setting or no timeout by default'
+        )
+        parser.add_argument(
+            '--index-type-timeout',
+            dest='index_type_timeouts',
+            type=self._name_value(float),
+            action='append',
+            default=None,
+            metavar='TYPE=SECONDS',
+            help='Timeout of jobs building indexes of the type like btree or gin, may be repeated'
+        )
+        parser.add_argument(
+            '--table-timeout',
+            dest='table_timeouts',
+            type=self._name_value(float),
+            action='append',
+            default=None,
+            metavar='PATTERN=SECONDS',
+            help='Timeout of jobs on tables matching the glob pattern, may be repeated'
+        )
+        parser.add_argument(
+            '--max-attempts',
+            dest='max_attempts',
+            type=int,
+            default=None,
+            metavar='N',
+            help='Maximal number of attempts to apply the job failed by a transient error, '
+            'POSTPONE_INDEX_MAX_ATTEMPTS setting or 3 by default'
+        )
+        parser.add_argument(
+            '--retry-backoff',
+            dest='retry_backoff',
+            type=float,
+            default=None,
+            metavar='SECONDS',
+            help='Initial delay before the retry doubled on every attempt, POSTPONE_INDEX_RETRY_BACKOFF setting or 5 by default'
+        )
+        parser.add_argument(
+            '--terminate-idle-in-transaction',
+            dest='terminate_idle_in_transaction',
+            type=float,
+            default=None,
+            metavar='SECONDS',
+            help='Terminate sessions blocking jobs being idle in transaction longer than this time, '
+            'POSTPONE_INDEX_TERMINATE_IDLE_IN_TRANSACTION setting or never by default'
+        )
+        parser.add_argument(
+            '--lock-timeout',
+            dest='lock_timeout',
+            type=float,
+            default=None,
+            metavar='SECONDS',
+            help='Lock timeout of brief steps taking the exclusive lock on the table, 0 to wait for the lock forever, '
+            'POSTPONE_INDEX_LOCK_TIMEOUT setting or 2 by default'
+        )
+        parser.add_argument(
+            '--lock-retry-deadline',
+            dest='lock_retry_deadline',
+            type=float,
+            default=None,
+            metavar='SECONDS',
+            help='Retry brief steps failed by the lock timeout during this time, '
+            'POSTPONE_INDEX_LOCK_RETRY_DEADLINE setting or 300 by default'
+        )
+        parser.add_argument(
+            '--session',
+            dest='session',
+            type=self._name_value(str),
+            action='append',
+            default=None,
+            metavar='NAME=VALUE',
+            help='Setting of the session applying the job overriding all session profiles, may be repeated'
+        )
+        parser.add_argument(
+            '--adaptive-session',
+            dest='adaptive_session',
+            action='store_true',
+            default=None,
+            help='Size the maintenance memory and parallel workers by the table of the job, '
+            'POSTPONE_INDEX_ADAPTIVE_SESSION setting by default'
+        )
+        parser.add_argument(
+            '--analyze',
+            dest='analyze',
+            choices=('auto', 'all', 'none'),
+            default=None,
+            help='Analyze the table after building expression or partial indexes (`auto`), any indexes (`all`), '
+            'or never (`none`), POSTPONE_INDEX_ANALYZE setting or `auto` by default'
+        )
+        parser.add_argument(
+            '--adopt',
+            dest='adopt',
+            action='store_const',
+            const=True,
+            default=None,
+            help='Adopt the equivalent index having another name instead of building, '
+            'POSTPONE_INDEX_ADOPT setting or never adopt by default'
+        )
+        parser.add_argument(
+            '--no-adopt',
+            dest='adopt',
+            action='store_const',
+            const=False,
+            help='Never adopt the equivalent index having another name, overriding the POSTPONE_INDEX_ADOPT setting'
+        )
+        parser.add_argument(
+            '--redundant',
+            dest='redundant',
+            choices=('report', 'skip', 'fail', 'none'),
+            default=None,
+            help='Report, skip, or fail the run on jobs building btree indexes covered by other jobs or existing indexes, '
+            'or do not check (`none`), POSTPONE_INDEX_REDUNDANT setting or `report` by default'
+        )
+        parser.add_argument(
+            '--check-duplicates',
+            dest='check_duplicates',
+            action='store_true',
+            default=None,
+            help='Check the table for duplicate keys before building the unique index, '
+            'POSTPONE_INDEX_CHECK_DUPLICATES setting by default'
+        )
+        parser.add_argument(
+            '--disk-probe',
+            dest='disk_probe',
+            default=None,
+            help='Free disk space probe, either `statvfs`, `sql`, or the dotted path to the probe class, '
+            'POSTPONE_INDEX_DISK_PROBE setting or no check by default'
+        )
+        parser.add_argument(
+            '--disk-action',
+            dest='disk_action',
+            choices=('defer', 'refuse'),
+            default=None,
+            help='Defer or refuse jobs not fitting the free disk space, POSTPONE_INDEX_DISK_ACTION setting or `defer` by default'
+        )
+        parser.add_argument(
+            '--disk-reserve',
+            dest='disk_reserve',
+            type=int,
+            default=None,
+            metavar='BYTES',
+            help='Disk space kept free, POSTPONE_INDEX_DISK_RESERVE setting or 0 by default'
+        )
+
+    @staticmethod
+    def _name_value(value_type):
+        """Argument type parsing `name=value` pair"""
+        def parse(s):
+            name, sep, value = s.partition('=')
+            if not sep or not name:
+                raise argparse.ArgumentTypeError('%r is not in the form name=value' % s)
+            return name, value_type(value)
+        return parse
+
+    @staticmethod
+    def _datetime(s):
+        """Argument type parsing ISO 8601 date and time, the current time zone by default, naive when USE_TZ is false"""
+        value = parse_datetime(s)
+        if value is None:
+            raise argparse.ArgumentTypeError('%r is not an ISO 8601 date and time' % s)
+        if settings.USE_TZ and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        elif not settings.USE_TZ and timezone.is_aware(value):
+            value = timezone.make_naive(value)
+        return value
+
+    @staticmethod
+    def _normalize_run_options(options):
+        """Convert options parsed as `name=value` pairs to dictionaries"""
+        for name in ('tablespace_jobs', 'database_jobs', 'priorities', 'index_type_timeouts', 'table_timeouts', 'session'):
+            if options.get(name):
+                options[name] = dict(options[name])
+
+    @contextmanager
+    def _interruptible(self, interrupted):
+        """
+        Interrupt running jobs on SIGTERM or SIGINT instead of terminating immediately.
+
+        The repeated signal terminates immediately. Raises `StatusCommandError`
+        with the conventional status 128 + signal number when interrupted.
+        """
+        received = []
+        if threading.current_thread() is not threading.main_thread():
+            # Signal handlers may be set only in the main thread
+            yield
+            return
+
+        def handler(signum, frame):
+            logger.warning('Received %s, interrupting running jobs', signal.Signals(signum).name)
+            received.append(signum)
+            for s, h in previous.items():
+                signal.signal(s, h)
+            interrupted.set()
+
+        previous = {s: signal.signal(s, handler) for s in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            yield
+        finally:
+            for s, h in previous.items():
+                signal.signal(s, h)
+        if received:
+            raise StatusCommandError('Interrupted by %s' % signal.Signals(received[0]).name, 128 + received[0])
@@ -23,10 +23,10 @@ class PostponedSQLQuerySet(models.QuerySet):
         """
         Create base package table if absent
         """
-        if self._is_present():
+        if self._is_present() and self._is_actual():
             logger.debug('[%s] The PostponedSQL storage already exists', self.db)
             return
-        logger.info('[%s] The PostponedSQL storage is absent, creating', self.db)
+        logger.info('[%s] The PostponedSQL storage is absent or outdated, creating', self.db)
         with open(os.path.join(package_folder, 'sql/start.sql')) as f:
             sql = f.read()
         cursor = connections[self.db].cursor()
@@ -53,6 +53,28 @@ class PostponedSQLQuerySet(models.QuerySet):
         )
         return bool(cursor.fetchall())
 
+    def _is_actual(self):
+        """
+        Check if all columns of the model and the notification trigger are present
+        """
+        cursor = connections[self.db].cursor()
+        cursor.execute(
+            """
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = '%s'
+            """ % PostponedSQL._meta.db_table
+        )
+        columns = {r[0] for r in cursor.fetchall()}
+        if not all(f.column in columns for f in PostponedSQL._meta.concrete_fields):
+            return False
+        cursor.execute(
+            """
+                SELECT 1 FROM information_schema.triggers
+                WHERE event_object_schema = 'public' AND event_object_table = '%s' AND trigger_name = '%s_notify' limit 1
+            """ % (PostponedSQL._meta.db_table, PostponedSQL._meta.db_table)
+        )
+        return bool(cursor.fetchall())
+
 
 class PostponedSQLManager(models.Manager):
     """
@@ -114,6 +136,62 @@ class PostponedSQL(models.Model):
         help_text=_('Last error reported when tried to apply')
     )
 
+    app_label = CharField(
+        blank=True, null=True,
+        verbose_name=_('Application'),
+        help_text=_('Label of the application which migration has postponed the command')
+    )
+    migration = CharField(
+        blank=True, null=True,
+        verbose_name=_('Migration'),
+        help_text=_('Name of the migration which has postponed the command')
+    )
+    claimed_by = CharField(
+        blank=True, null=True,
+        verbose_name=_('Claimed by'),
+        help_text=_('Worker which has claimed the job last time')
+    )
+    claimed_at = models.DateTimeField(
+        blank=True, null=True,
+        verbose_name=_('Claimed at'),
+        help_text=_('Time when the job has been claimed last time')
+    )
+    lease_until = models.DateTimeField(
+        blank=True, null=True,
+        verbose_name=_('Lease until'),
+        help_text=_('The job is leased by the claiming worker until this time')
+    )
+    heartbeat = models.DateTimeField(
+        blank=True, null=True,
+        verbose_name=_('Heartbeat'),
+        help_text=_('Last heartbeat of the worker running the job')
+    )
+    duration = models.FloatField(
+        blank=True, null=True,
+        verbose_name=_('Duration'),
+        help_text=_('Duration of the last successful run in seconds')
+    )
+    pages = models.BigIntegerField(
+        blank=True, null=True,
+        verbose_name=_('Pages'),
+        help_text=_('Size of the table in pages when the job has been applied last time')
+    )
+    attempts = models.IntegerField(
+        default=0,
+        verbose_name=_('Attempts'),
+        help_text=_('Number of attempts to apply the job')
+    )
+    blockers = models.TextField(
+        blank=True, null=True,
+        verbose_name=_('Blockers'),
+        help_text=_('Sessions blocking the job last time in JSON form')
+    )
+    duplicates = models.TextField(
+        blank=True, null=True,
+        verbose_name=_('Duplicates'),
+        help_text=_('Duplicate keys found by the check before building the unique index in JSON form')
+    )
+
     objects = PostponedSQLManager()
 
     @property
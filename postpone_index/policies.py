@@ -0,0 +1,114 @@
+"""
+Scheduling policies ordering postponed jobs before applying.
+"""
+from fnmatch import fnmatchcase
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+
+class Policy:
+    """
+    Base scheduling policy.
+
+    The policy orders pending jobs of the runner. Jobs are started
+    in this order as soon as their prerequisites are applied
+    and their table is free.
+    """
+
+    def __init__(self, runner):
+        self.runner = runner
+
+    @classmethod
+    def load(cls, name):
+        """Policy class by the built-in name or the dotted path"""
+        if name in POLICIES:
+            return POLICIES[name]
+        try:
+            return import_string(name)
+        except ImportError as ex:
+            raise ValueError('Unknown scheduling policy %r: %s' % (name, ex))
+
+    def key(self, job):
+        """Sorting key of the job"""
+        return job.ts
+
+    def order(self, jobs):
+        """Order jobs to be applied"""
+        return sorted(jobs, key=self.key)
+
+
+class TimePolicy(Policy):
+    """Jobs in the original time order"""
+
+
+class ShortestJobFirstPolicy(Policy):
+    """Jobs on the smallest tables first, estimated by the `pg_class.relpages`"""
+
+    def order(self, jobs):
+        """Order jobs to be applied"""
+        tables = sorted({j.table for j in jobs if j.table})
+        with connections[self.runner.database].cursor() as cursor:
+            cursor.execute(
+                """
+                    SELECT t.name, c.relpages FROM unnest(%s::text[]) t(name)
+                    JOIN pg_class c ON c.oid = to_regclass(quote_ident(t.name))
+                """, [tables]
+            )
+            self._pages = dict(cursor.fetchall())
+        return super().order(jobs)
+
+    def key(self, job):
+        """Sorting key of the job"""
+        return (self._pages.get(job.table, 0), job.ts)
+
+
+class PriorityPolicy(Policy):
+    """
+    Jobs of the higher explicit priority first.
+
+    The priority is taken from the first `{'pattern': N}` pair where
+    the glob pattern matches the index or table name of the job, 0 by default.
+    """
+
+    def __init__(self, runner):
+        super().__init__(runner)
+        # Patterns passed explicitly are checked first
+        self.priorities = dict(runner.priorities or {})
+        for pattern, priority in (getattr(settings, 'POSTPONE_INDEX_PRIORITIES', None) or {}).items():
+            self.priorities.setdefault(pattern, priority)
+
+    def priority(self, job):
+        """Explicit priority of the job"""
+        for pattern, priority in self.priorities.items():
+            if any(fnmatchcase(name, pattern) for name in (job.db_index, job.table) if name):
+                return priority
+        return 0
+
+    def key(self, job):
+        """Sorting key of the job"""
+        return (-self.priority(job), job.ts)
+
+
+class LocalityPolicy(Policy):
+    """All jobs of one table back-to-back while the table is still hot in cache"""
+
+    def order(self, jobs):
+        """Order jobs to be applied"""
+        self._first = {}
+        for job in sorted(jobs, key=lambda j: j.ts):
+            self._first.setdefault(job.table, job.ts)
+        return super().order(jobs)
+
+    def key(self, job):
+        """Sorting key of the job"""
+        return (self._first[job.table], job.ts)
+
+
+POLICIES = {
+    'ts': TimePolicy,
+    'sjf': ShortestJobFirstPolicy,
+    'priority': PriorityPolicy,
+    'locality': LocalityPolicy,
+}
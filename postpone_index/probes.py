@@ -0,0 +1,98 @@
+"""
+Probes of the free disk space checked before applying postponed jobs.
+"""
+import logging
+import os
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+class Probe:
+    """
+    Base free disk space probe.
+
+    The probe reports bytes available for the tablespace, None if unknown,
+    so the job is applied without the check.
+    """
+
+    def __init__(self, runner):
+        self.runner = runner
+
+    @classmethod
+    def load(cls, name):
+        """Probe class by the built-in name or the dotted path"""
+        if name in PROBES:
+            return PROBES[name]
+        try:
+            return import_string(name)
+        except ImportError as ex:
+            raise ValueError('Unknown disk space probe %r: %s' % (name, ex))
+
+    def free(self, tablespace):
+        """Bytes available for the tablespace"""
+        return None
+
+
+class StatvfsProbe(Probe):
+    """
+    Free space of the file system of the tablespace when the database server runs on the same host.
+
+    The directory of the tablespace is taken from the `POSTPONE_INDEX_TABLESPACE_PATHS` setting,
+    otherwise asked from the server, that requires the `pg_read_all_settings` role for the default tablespace.
+    """
+
+    def free(self, tablespace):
+        """Bytes available for the tablespace"""
+        path = (getattr(settings, 'POSTPONE_INDEX_TABLESPACE_PATHS', None) or {}).get(tablespace)
+        if not path:
+            try:
+                with connections[self.runner.database].cursor() as cursor:
+                    cursor.execute(
+                        """
+                            SELECT CASE WHEN spcname IN ('pg_default', 'pg_global')
+                                THEN current_setting('data_directory') ELSE pg_tablespace_location(oid) END
+                            FROM pg_tablespace WHERE spcname = %s
+                        """, [tablespace]
+                    )
+                    row = cursor.fetchone()
+            except DatabaseError as ex:
+                logger.warning(
+                    '[%s] Directory of the tablespace %s is unknown, free space is not checked: %s',
+                    self.runner.database, tablespace, ex
+                )
+                return None
+            path = row[0] if row else None
+        if not path or not os.path.isdir(path):
+            return None
+        stat = os.statvfs(path)
+        return stat.f_bavail * stat.f_frsize
+
+
+class SQLProbe(Probe):
+    """
+    Free space reported by the query of the `POSTPONE_INDEX_FREE_SPACE_SQL` setting.
+
+    The query takes the tablespace name as the only parameter
+    and returns bytes available, f.e. `SELECT my_free_space(%s)`.
+    """
+
+    def free(self, tablespace):
+        """Bytes available for the tablespace"""
+        sql = getattr(settings, 'POSTPONE_INDEX_FREE_SPACE_SQL', None)
+        if not sql:
+            return None
+        with connections[self.runner.database].cursor() as cursor:
+            cursor.execute(sql, [tablespace])
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+
+PROBES = {
+    'statvfs': StatvfsProbe,
+    'sql': SQLProbe,
+}
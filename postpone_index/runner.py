@@ -0,0 +1,1796 @@
+"""
+Runner applying postponed index and constraint creation jobs
+in CONCURRENTLY manner.
+"""
+import json
+import logging
+import os
+import random
+import re
+import select
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from fnmatch import fnmatchcase
+
+from django.apps import apps
+from django.conf import settings
+from django.db import (
+    DatabaseError,
+    InterfaceError,
+    OperationalError,
+    connections,
+    router,
+    transaction,
+)
+from django.db.models import DateTimeField, ExpressionWrapper, Q, Sum
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from postpone_index.admission import Admission
+from postpone_index.models import PostponedSQL
+from postpone_index.policies import Policy
+from postpone_index.probes import Probe
+from postpone_index.utils import Utils
+from postpone_index.windows import Window
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """The running job has been cancelled"""
+
+
+class RedundantIndexes(Exception):
+    """Pending jobs build redundant indexes"""
+
+
+class DuplicateKeys(Exception):
+    """The table has duplicate keys of the unique index to be built"""
+
+
+class Runner(Utils):
+    """
+    Applies not yet applied postponed jobs of a single database alias.
+
+    Jobs on different tables are applied in parallel by a pool of workers,
+    every worker using it's own autocommit connection. Jobs on the same table
+    are never applied concurrently because concurrent index builds conflict on the table.
+
+    Jobs are scheduled as a dependency graph derived from the parsed jobs,
+    so a job waits only for it's prerequisites, and a failed job skips
+    only jobs depending on it. Jobs ready to be applied are started
+    in the order defined by the scheduling policy.
+
+    Every job is claimed before applying using the `FOR UPDATE SKIP LOCKED` technique
+    and leased by the worker while applying, so several runners on several hosts
+    may drain the same queue cooperatively. Leases of crashed workers expire
+    and are reclaimed by other runners.
+    """
+    poll_interval = 1.0
+    job_overhead = 1.0
+    retry_backoff_max = 600.0
+    blocker_interval = 5.0
+    lock_retry_delay_max = 30.0
+    index_type_storage = {
+        # Entries inserted while the index is being built concurrently go to the index instead of the pending list
+        'gin': {'fastupdate': 'off'},
+    }
+    index_type_finalize = {
+        # Ranges filled while the index was being built concurrently are not summarized
+        'brin': 'SELECT brin_summarize_new_values(%s::regclass)',
+        # Entries inserted while the index was being built concurrently wait in the pending list
+        'gin': 'SELECT gin_clean_pending_list(%s::regclass)',
+    }
+    _clause_re = re.compile(r'\s(?P<clause>WITH|TABLESPACE|WHERE)\b', re.IGNORECASE)
+    # SQLSTATE codes and classes of transient errors
+    retry_sqlstates = (
+        '08',  # connection exception
+        '40001',  # serialization_failure
+        '40P01',  # deadlock_detected
+        '53300',  # too_many_connections
+        '55P03',  # lock_not_available
+        '57P01',  # admin_shutdown
+        '57P02',  # crash_shutdown
+        '57P03',  # cannot_connect_now
+    )
+    _lock_class = 0x706f7374
+
+    def __init__(
+        self, database='default', exception=False, jobs=None, tablespace_jobs=None, lease=None,
+        semaphore=None, abort=None, eligible=None, refresh=None, started=None,
+        policy=None, priorities=None, tables=None, indexes=None, apps=None,
+        windows=None, window_cancel=None, max_duration=None, deadline=None,
+        max_replication_lag=None, max_active_backends=None, max_wal_rate=None,
+        replica_wait=None, replicas=None, interrupted=None,
+        timeout=None, index_type_timeouts=None, table_timeouts=None,
+        max_attempts=None, retry_backoff=None, terminate_idle_in_transaction=None,
+        lock_timeout=None, lock_retry_deadline=None, session=None, adaptive_session=None,
+        analyze=None, adopt=None, redundant=None, check_duplicates=None,
+        disk_probe=None, disk_action=None, disk_reserve=None, **kw
+    ):
+        """Initialize by the command options falling back to the settings"""
+        self.database = database
+        self.exception = exception
+        self.semaphore = semaphore
+        self.abort = abort or threading.Event()
+        self.interrupted = interrupted or threading.Event()
+        self.stopped = None
+        self.eligible = eligible
+        self.refresh = refresh
+        self._selected = set()
+        self.jobs = max(1, jobs or getattr(settings, 'POSTPONE_INDEX_JOBS', 1))
+        self.tablespace_jobs = dict(getattr(settings, 'POSTPONE_INDEX_TABLESPACE_JOBS', None) or {})
+        self.tablespace_jobs.update(tablespace_jobs or {})
+        self.lease = lease or getattr(settings, 'POSTPONE_INDEX_LEASE', 120)
+        self.worker = '%s:%s:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self._disk_settings = {}
+        self._claimed = set()
+        self._lock = threading.Lock()
+        self._started = started
+        self.priorities = priorities
+        self.tables = tables
+        self.indexes = indexes
+        self.apps = apps
+        self.policy = Policy.load(policy or getattr(settings, 'POSTPONE_INDEX_POLICY', None) or 'ts')(self)
+        if windows is None:
+            windows = getattr(settings, 'POSTPONE_INDEX_WINDOWS', None) or []
+            if isinstance(windows, dict):
+                windows = windows.get(database) or []
+        self.windows = [Window(w) for w in windows]
+        if window_cancel is None:
+            window_cancel = getattr(settings, 'POSTPONE_INDEX_WINDOW_CANCEL', False)
+        self.window_cancel = window_cancel
+        self._paused = False
+        self._pids = {}
+        self._cancelled = {}
+        self._local = threading.local()
+        if deadline is not None and settings.USE_TZ != timezone.is_aware(deadline):
+            # Comparable with timezone.now()
+            deadline = timezone.make_aware(deadline) if settings.USE_TZ else timezone.make_naive(deadline)
+        self.deadline = deadline
+        if max_duration:
+            limit = timezone.now() + timedelta(seconds=max_duration)
+            self.deadline = min(self.deadline, limit) if self.deadline else limit
+        self._estimates = {}
+        self.admission = Admission(
+            database,
+            max_replication_lag=self._option(max_replication_lag, 'POSTPONE_INDEX_MAX_REPLICATION_LAG'),
+            max_active_backends=self._option(max_active_backends, 'POSTPONE_INDEX_MAX_ACTIVE_BACKENDS'),
+            max_wal_rate=self._option(max_wal_rate, 'POSTPONE_INDEX_MAX_WAL_RATE'),
+        )
+        self._waiting = []
+        self.replica_wait = self._option(replica_wait, 'POSTPONE_INDEX_REPLICA_WAIT')
+        self.replicas = self._option(replicas, 'POSTPONE_INDEX_REPLICAS')
+        self.timeout = self._option(timeout, 'POSTPONE_INDEX_TIMEOUT')
+        self.index_type_timeouts = {
+            k.lower(): v for k, v in [
+                *(getattr(settings, 'POSTPONE_INDEX_INDEX_TYPE_TIMEOUTS', None) or {}).items(),
+                *(index_type_timeouts or {}).items(),
+            ]
+        }
+        # Patterns passed explicitly are checked first
+        self.table_timeouts = dict(table_timeouts or {})
+        for pattern, seconds in (getattr(settings, 'POSTPONE_INDEX_TABLE_TIMEOUTS', None) or {}).items():
+            self.table_timeouts.setdefault(pattern, seconds)
+        self._deadlines = {}
+        self.max_attempts = max(1, self._option(max_attempts, 'POSTPONE_INDEX_MAX_ATTEMPTS') or 3)
+        self.retry_backoff = self._option(retry_backoff, 'POSTPONE_INDEX_RETRY_BACKOFF')
+        if self.retry_backoff is None:
+            self.retry_backoff = 5.0
+        self.retry_sqlstates = tuple(getattr(settings, 'POSTPONE_INDEX_RETRY_SQLSTATES', None) or self.retry_sqlstates)
+        self.terminate_idle_in_transaction = self._option(
+            terminate_idle_in_transaction, 'POSTPONE_INDEX_TERMINATE_IDLE_IN_TRANSACTION'
+        )
+        self._running = {}
+        self._blockers = {}
+        self.lock_timeout = self._option(lock_timeout, 'POSTPONE_INDEX_LOCK_TIMEOUT')
+        if self.lock_timeout is None:
+            self.lock_timeout = 2.0
+        self.lock_retry_deadline = self._option(lock_retry_deadline, 'POSTPONE_INDEX_LOCK_RETRY_DEADLINE')
+        if self.lock_retry_deadline is None:
+            self.lock_retry_deadline = 300.0
+        self._built = set()
+        self._not_before = {}
+        self.session = {'statement_timeout': 0}
+        self.session.update(getattr(settings, 'POSTPONE_INDEX_SESSION', None) or {})
+        self.session.update((getattr(settings, 'POSTPONE_INDEX_DATABASE_SESSIONS', None) or {}).get(database) or {})
+        self.index_type_sessions = {
+            k.lower(): v for k, v in (getattr(settings, 'POSTPONE_INDEX_INDEX_TYPE_SESSIONS', None) or {}).items()
+        }
+        self.table_sessions = dict(getattr(settings, 'POSTPONE_INDEX_TABLE_SESSIONS', None) or {})
+        # Settings passed explicitly override all profiles
+        self.session_options = dict(session or {})
+        self.adaptive_session = self._option(adaptive_session, 'POSTPONE_INDEX_ADAPTIVE_SESSION')
+        self.adaptive_memory = (getattr(settings, 'POSTPONE_INDEX_ADAPTIVE_MAINTENANCE_WORK_MEM', None) or 1024) * 1024 * 1024
+        self.index_type_storage = {
+            k.lower(): v for k, v in [
+                *self.index_type_storage.items(),
+                *(getattr(settings, 'POSTPONE_INDEX_INDEX_TYPE_STORAGE', None) or {}).items(),
+            ]
+        }
+        self.index_type_finalize = {
+            k.lower(): v for k, v in [
+                *self.index_type_finalize.items(),
+                *(getattr(settings, 'POSTPONE_INDEX_INDEX_TYPE_FINALIZE', None) or {}).items(),
+            ]
+        }
+        self.analyze = self._option(analyze, 'POSTPONE_INDEX_ANALYZE') or 'auto'
+        if self.analyze not in ('auto', 'all', 'none'):
+            raise ValueError('Unknown analyze mode %r' % self.analyze)
+        self._unanalyzed = set()
+        self.adopt = bool(self._option(adopt, 'POSTPONE_INDEX_ADOPT'))
+        self.redundant = self._option(redundant, 'POSTPONE_INDEX_REDUNDANT') or 'report'
+        if self.redundant not in ('report', 'skip', 'fail', 'none'):
+            raise ValueError('Unknown redundant index policy %r' % self.redundant)
+        self.check_duplicates = self._option(check_duplicates, 'POSTPONE_INDEX_CHECK_DUPLICATES')
+        self.duplicates_limit = getattr(settings, 'POSTPONE_INDEX_DUPLICATES_LIMIT', None) or 20
+        self.duplicates_scan_pages = getattr(settings, 'POSTPONE_INDEX_DUPLICATES_SCAN_PAGES', None) or 12800
+        disk_probe = self._option(disk_probe, 'POSTPONE_INDEX_DISK_PROBE')
+        self.disk_probe = Probe.load(disk_probe)(self) if disk_probe else None
+        self.disk_action = self._option(disk_action, 'POSTPONE_INDEX_DISK_ACTION') or 'defer'
+        if self.disk_action not in ('defer', 'refuse'):
+            raise ValueError('Unknown disk space action %r' % self.disk_action)
+        self.disk_reserve = self._option(disk_reserve, 'POSTPONE_INDEX_DISK_RESERVE') or 0
+        self._space = {}
+        self._space_estimates = {}
+        self._deferred = set()
+        self._disk_blocked = False
+        self._pending_tables = frozenset()
+
+    @staticmethod
+    def _option(value, setting):
+        """Option value falling back to the setting"""
+        return value if value is not None else getattr(settings, setting, None)
+
+    def run(self):
+        """
+        Apply all not yet applied jobs.
+
+        Returns jobs left because of the time budget with their estimated durations,
+        the reason to stop the loop is kept in the `stopped` attribute.
+        """
+        self.stopped = None
+        PostponedSQL.objects.using(self.database)._create_base_tables()
+        if not self._started:
+            with connections[self.database].cursor() as cursor:
+                cursor.execute('SELECT now()')
+                self._started = cursor.fetchone()[0]
+        jobs = list(PostponedSQL.objects.using(self.database).filter(done=False).order_by('ts'))
+        self._prerequisites = self._dependencies(jobs)
+        pending = self.policy.order(self._filter(jobs))
+        self._publish(pending)
+        self._selected = {j.ts for j in pending}
+        if self.redundant != 'none':
+            self._check_redundant(pending)
+        if self.deadline:
+            self._estimate(pending)
+        running = {}
+        failure = None
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(stop,), name='postpone_index_heartbeat', daemon=True)
+        heartbeat.start()
+        watchdog = threading.Thread(target=self._watchdog, args=(stop,), name='postpone_index_watchdog', daemon=True)
+        watchdog.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix='postpone_index') as pool:
+                while pending or running:
+                    if self.refresh is not None and self.refresh.is_set():
+                        self.refresh.clear()
+                        pending = self._reload(pending)
+                    if self.interrupted.is_set():
+                        for job in running.values():
+                            self._cancel(job, 'Interrupted', retry=True)
+                        if not running:
+                            self.stopped = 'interrupted'
+                            break
+                    elif self.abort.is_set():
+                        if not running:
+                            self.stopped = 'abort'
+                            break
+                    elif self._in_window(running) and self._admitted():
+                        for job in self._select(pending, running):
+                            if self.semaphore and not self.semaphore.acquire(blocking=False):
+                                # The cluster-wide limit is reached
+                                self._unreserve(job)
+                                break
+                            if self._claim(job):
+                                pending.remove(job)
+                                running[pool.submit(self._run_job, job)] = job
+                                continue
+                            self._unreserve(job)
+                            if self.semaphore:
+                                self.semaphore.release()
+                            if self._finished(job):
+                                # Applied or failed by another runner
+                                pending.remove(job)
+                    if not running and self._exhausted(pending):
+                        logger.warning('[%s] The time budget is exhausted, %s jobs left', self.database, len(pending))
+                        self.stopped = 'budget'
+                        break
+                    if not running and self._disk_blocked:
+                        logger.warning('[%s] Not enough disk space, %s jobs left', self.database, len(pending))
+                        self.stopped = 'disk'
+                        break
+                    if not running:
+                        # Jobs are leased by other runners, or the window is closed
+                        time.sleep(self.poll_interval)
+                        continue
+                    self._publish(pending)
+                    done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job = running.pop(future)
+                        try:
+                            result = future.result()
+                            if result is None:
+                                # Cancelled or failed transiently, will be applied again
+                                pending = self.policy.order(pending + [job])
+                            elif not result:
+                                self._skip(job, pending)
+                        except Exception as ex:
+                            # Stop scheduling new jobs, but let running jobs finish
+                            failure = failure or ex
+                            self.abort.set()
+        finally:
+            stop.set()
+            heartbeat.join()
+            watchdog.join()
+        if failure is not None:
+            raise failure
+        if not self.interrupted.is_set():
+            # Tables with jobs left, failed, or applied by other runners
+            for table in sorted(self._unanalyzed):
+                self._analyze_table(table)
+        return [(j, self._estimates.get(j.ts)) for j in pending] if self.stopped == 'budget' else []
+
+    def _publish(self, pending):
+        """
+        Publish tables of pending jobs to worker threads, only the scheduling loop changes pending jobs.
+
+        Jobs on the table of the running job are not claimed, so the stale snapshot may only defer
+        the analyze of the table till the end of the run, or repeat it for jobs added since.
+        """
+        tables = frozenset(j.table for j in pending)
+        with self._lock:
+            self._pending_tables = tables
+
+    def _in_window(self, running):
+        """Check whether the maintenance window is open, cancel running jobs if configured"""
+        now = timezone.now()
+        inside = not self.windows or any(now in w for w in self.windows)
+        if inside:
+            if self._paused:
+                logger.info('[%s] Inside of the maintenance window, resumed', self.database)
+            self._paused = False
+            return True
+        if not self._paused:
+            logger.info(
+                '[%s] Outside of the maintenance window, paused till one of: %s',
+                self.database, ', '.join(str(w) for w in self.windows)
+            )
+        self._paused = True
+        if self.window_cancel:
+            for job in running.values():
+                self._cancel(job, 'Cancelled: outside of the maintenance window', retry=True)
+        return False
+
+    def _admitted(self):
+        """Check whether the database load allows to start new jobs"""
+        if not self.admission:
+            return True
+        with self._lock:
+            pids = list(self._pids.values())
+        reasons = self.admission.reasons(pids)
+        if reasons != self._waiting:
+            if reasons:
+                logger.info('[%s] Waiting for the database load: %s', self.database, ', '.join(reasons))
+            else:
+                logger.info('[%s] The database load allows to start jobs', self.database)
+        self._waiting = reasons
+        return not reasons
+
+    def _cancel(self, job, reason, retry):
+        """Cancel the running job, the job to be retried may be claimed again"""
+        with self._lock:
+            if job.ts in self._cancelled:
+                return
+            self._cancelled[job.ts] = (reason, retry)
+            pid = self._pids.get(job.ts)
+        logger.warning('[%s] Cancelling (%s): %s', self.database, reason, job.description)
+        if pid:
+            with connections[self.database].cursor() as cursor:
+                cursor.execute('SELECT pg_cancel_backend(%s)', [pid])
+
+    def _select(self, pending, running):
+        """Select pending jobs which may be started right now"""
+        self._disk_blocked = False
+        tables = {j.table for j in running.values()}
+        tablespaces = Counter(self._tablespace(j) for j in running.values())
+        waiting = {j.ts for j in pending} | {j.ts for j in running.values()}
+        started = len(running)
+        for job in list(pending):
+            if started >= self.jobs:
+                return
+            if self._prerequisites.get(job.ts, set()) & waiting:
+                continue
+            if self.eligible and not self.eligible(job):
+                # Not eligible anymore
+                continue
+            if job.table in tables:
+                continue
+            if self._not_before.get(job.ts, 0) > time.monotonic():
+                # Waiting for the retry
+                continue
+            if not self._fits(job):
+                continue
+            tablespace = self._tablespace(job)
+            limit = self.tablespace_jobs.get(tablespace)
+            tables.add(job.table)
+            if limit and tablespaces[tablespace] >= limit:
+                continue
+            if not self._reserve(job, pending):
+                continue
+            tablespaces[tablespace] += 1
+            started += 1
+            yield job
+
+    def _pages(self, tables):
+        """Sizes of tables in pages"""
+        with connections[self.database].cursor() as cursor:
+            cursor.execute(
+                """
+                    SELECT t.name, pg_relation_size(c.oid) / current_setting('block_size')::int
+                    FROM unnest(%s::text[]) t(name)
+                    JOIN pg_class c ON c.oid = to_regclass(quote_ident(t.name))
+                """, [sorted(tables)]
+            )
+            return dict(cursor.fetchall())
+
+    def _estimate(self, jobs):
+        """
+        Estimate durations of jobs in seconds.
+
+        The duration of the previous run of the same index is scaled by the table size if known,
+        otherwise the table size is multiplied by the average time per page of previous runs.
+        """
+        queryset = PostponedSQL.objects.using(self.database).filter(done=True, duration__isnull=False)
+        previous = {
+            (table, db_index): (duration, pages)
+            for table, db_index, duration, pages in queryset.order_by('ts').values_list('table', 'db_index', 'duration', 'pages')
+        }
+        # Small tables are not representative because of the job overhead
+        total = queryset.filter(pages__gte=1000).aggregate(duration=Sum('duration'), pages=Sum('pages'))
+        if total['pages']:
+            seconds_per_page = total['duration'] / total['pages']
+        else:
+            seconds_per_page = getattr(settings, 'POSTPONE_INDEX_SECONDS_PER_PAGE', 0.0001)
+        sizes = self._pages({j.table for j in jobs if j.table})
+        for job in jobs:
+            pages = sizes.get(job.table, 0)
+            if (job.table, job.db_index) in previous:
+                duration, previous_pages = previous[(job.table, job.db_index)]
+                self._estimates[job.ts] = duration * max(pages, 1) / max(previous_pages or 0, 1)
+            else:
+                self._estimates[job.ts] = self.job_overhead + pages * seconds_per_page
+
+    def _fits(self, job):
+        """Check whether the job is expected to finish before the deadline"""
+        if not self.deadline:
+            return True
+        return timezone.now() + timedelta(seconds=self._estimates.get(job.ts, 0)) <= self.deadline
+
+    def _exhausted(self, pending):
+        """Check whether none of jobs ready to be applied fits the time budget"""
+        if not self.deadline or not pending:
+            return False
+        waiting = {j.ts for j in pending}
+        return not any(self._fits(j) for j in pending if not self._prerequisites.get(j.ts, set()) & waiting)
+
+    def _space_needed(self, job):
+        """
+        Estimate the disk space needed by the job in bytes, the index size and the sort spill.
+
+        The index size is estimated by the number of rows and average widths of key columns from the `pg_stats`,
+        the average row width is used for expressions and columns without statistics. The sort spills
+        to temporary files about the index size when the index does not fit the `maintenance_work_mem`
+        of the job connection. The table size is used when the table has never been analyzed.
+        """
+        if job.ts in self._space_estimates:
+            return self._space_estimates[job.ts]
+        index = spill = 0
+        match = self._create_index_re.fullmatch(job.sql) or self._add_constraint_re.fullmatch(job.sql)
+        if match and job.table:
+            rest = match.group('rest')
+            columns = [] if '(' in self._extract_enclosed(rest) else [c.strip('"') for c in self._extract_column_names(rest)]
+            with connections[self.database].cursor() as cursor:
+                cursor.execute(
+                    """
+                        SELECT
+                            c.reltuples, pg_relation_size(c.oid),
+                            (
+                                SELECT COALESCE(sum(s.avg_width), 0) FROM pg_stats s
+                                WHERE s.schemaname = 'public' AND s.tablename = %s AND s.attname = ANY(%s)
+                            ),
+                            (
+                                SELECT count(*) FROM pg_stats s
+                                WHERE s.schemaname = 'public' AND s.tablename = %s AND s.attname = ANY(%s)
+                            )
+                        FROM pg_class c WHERE c.oid = to_regclass(%s)
+                    """, [job.table, columns, job.table, columns, '"%s"' % job.table]
+                )
+                row = cursor.fetchone()
+            if row:
+                rows, size, width, known = row
+                if rows > 0:
+                    row_width = size / rows
+                    width += (len(columns) - known if columns else 1) * row_width
+                    # Index tuple header and line pointer, btree pages are filled by 90%
+                    index = int(rows * (width + 16) / 0.9)
+                else:
+                    index = size
+                spill = index if index > self._disk_settings_of(job)[2] else 0
+        self._space_estimates[job.ts] = (index, spill)
+        return index, spill
+
+    def _reserve(self, job, pending):
+        """
+        Reserve the disk space for the job if it fits the free space of tablespaces.
+
+        The index is built on the tablespace of the index, while the sort spills to the temporary tablespace.
+        The space reserved by running jobs on the same tablespace is not considered free.
+        The job not fitting is deferred or refused.
+        """
+        if not self.disk_probe:
+            return True
+        index, spill = self._space_needed(job)
+        needs = Counter({self._tablespace(job): index})
+        needs[self._disk_settings_of(job)[1]] += spill
+        free = {t: self.disk_probe.free(t) for t in needs}
+        with self._lock:
+            reserved = Counter()
+            for space in self._space.values():
+                reserved.update(space)
+            short = [t for t, n in needs.items() if free[t] is not None and n + reserved[t] + self.disk_reserve > free[t]]
+            if not short:
+                self._space[job.ts] = needs
+                self._deferred.discard(job.ts)
+                return True
+        tablespace = short[0]
+        reason = 'needs %s bytes on %s, %s bytes available, %s reserved' % (
+            needs[tablespace], tablespace, free[tablespace], reserved[tablespace]
+        )
+        if self.disk_action == 'refuse':
+            logger.warning('[%s] Refused, %s: %s', self.database, reason, job.description)
+            pending.remove(job)
+            PostponedSQL.objects.using(self.database).filter(ts=job.ts, done=False).update(
+                error='Refused: %s' % reason
+            )
+            self._skip(job, pending)
+            return False
+        if job.ts not in self._deferred:
+            logger.warning('[%s] Deferred, %s: %s', self.database, reason, job.description)
+            self._deferred.add(job.ts)
+        self._disk_blocked = True
+        return False
+
+    def _unreserve(self, job):
+        """Release the disk space reserved for the job not started"""
+        with self._lock:
+            self._space.pop(job.ts, None)
+
+    def _matches(self, job):
+        """Check whether the job is selected by filters"""
+        if self.eligible and not self.eligible(job):
+            return False
+        for patterns, name in ((self.tables, job.table), (self.indexes, job.db_index), (self.apps, job.app_label)):
+            if patterns and not any(fnmatchcase(name or '', p) for p in patterns):
+                return False
+        return True
+
+    def _filter(self, jobs, selected=()):
+        """Jobs selected by filters having all prerequisites selected too, or among already selected ones"""
+        selected = set(selected)
+        for job in jobs:
+            if not self._matches(job):
+                continue
+            if self._prerequisites[job.ts] - selected:
+                logger.info('[%s] Deferred, prerequisite is not selected: %s', self.database, job.description)
+                continue
+            selected.add(job.ts)
+        return [j for j in jobs if j.ts in selected]
+
+    def _reload(self, pending):
+        """Add jobs selected since the start, f.e. postponed by migrations committed later or eligible now"""
+        jobs = list(PostponedSQL.objects.using(self.database).filter(done=False).order_by('ts'))
+        self._prerequisites = self._dependencies(jobs)
+        added = self._filter([j for j in jobs if j.ts not in self._selected], self._selected)
+        if not added:
+            return pending
+        logger.info('[%s] %s jobs added', self.database, len(added))
+        self._selected.update(j.ts for j in added)
+        if self.deadline:
+            self._estimate(added)
+        return self.policy.order(pending + added)
+
+    @staticmethod
+    def _dependencies(jobs):
+        """
+        Derive prerequisites of every job from the parsed jobs.
+
+        The rebuild of the same index depends on the previous build of the index.
+        The unrecognized job may touch anything, so it depends on all previous jobs,
+        and all following jobs depend on it.
+        """
+        ret = {}
+        barrier = None
+        since_barrier = []
+        indexes = {}
+        for job in sorted(jobs, key=lambda j: j.ts):
+            prerequisites = {barrier} if barrier else set()
+            if job.table is None:
+                prerequisites.update(since_barrier)
+                barrier = job.ts
+                since_barrier = []
+            else:
+                key = (job.table, job.db_index)
+                if job.db_index and key in indexes:
+                    prerequisites.add(indexes[key])
+                indexes[key] = job.ts
+                since_barrier.append(job.ts)
+            ret[job.ts] = prerequisites
+        return ret
+
+    def _skip(self, failed, pending):
+        """Skip pending jobs depending on the failed job"""
+        skipped = {failed.ts}
+        for job in list(pending):
+            if not self._prerequisites.get(job.ts, set()) & skipped:
+                continue
+            skipped.add(job.ts)
+            pending.remove(job)
+            logger.warning('[%s] Skipped, prerequisite failed: %s', self.database, job.description)
+            PostponedSQL.objects.using(self.database).filter(ts=job.ts, done=False).filter(
+                Q(lease_until__isnull=True) | Q(lease_until__lt=Now())
+            ).update(error='Skipped: prerequisite failed: %s' % failed.description)
+
+    def _check_redundant(self, pending):
+        """Report, skip or fail on pending jobs building redundant indexes by the policy"""
+        redundant = self._redundant(pending)
+        for job, covering in redundant.items():
+            logger.warning('[%s] Redundant, covered by %s: %s', self.database, covering, job.description)
+        if not redundant:
+            return
+        if self.redundant == 'fail':
+            raise RedundantIndexes('%s redundant indexes: %s' % (
+                len(redundant), ', '.join(j.db_index for j in redundant)
+            ))
+        if self.redundant == 'skip':
+            for job, covering in redundant.items():
+                pending.remove(job)
+                PostponedSQL.objects.using(self.database).filter(ts=job.ts, done=False).update(
+                    error='Skipped: redundant, covered by %s' % covering
+                )
+
+    def _redundant(self, jobs):
+        """
+        Jobs building btree indexes covered by other jobs or existing indexes on the same table.
+
+        The non-unique index is covered by another btree index with the same predicate when its columns
+        are the leading columns of the other one. Of identical indexes the later job is redundant.
+        Returns names of covering indexes by jobs.
+        """
+        candidates = {}
+        for job in jobs:
+            if not job.table or not job.db_index:
+                continue
+            if match := self._create_index_re.fullmatch(job.sql):
+                unique = match.group('unique') or ''
+            elif match := self._add_constraint_re.fullmatch(job.sql):
+                unique = 'UNIQUE '
+            else:
+                continue
+            if expected := self._expected(unique, job.table, match.group('rest')):
+                candidates.setdefault(job.table, []).append((job, self._indexdef_parts(expected)))
+        ret = {}
+        for table, indexed in candidates.items():
+            names = {j.db_index for j, _ in indexed}
+            managed = self._managed(table) if self.adopt else set()
+            # The identical existing index is adopted instead if possible
+            existing = [
+                (name, self._indexdef_parts(definition), not self.adopt or name in managed)
+                for name, (valid, definition, _) in sorted(self._indexes(table).items())
+                if valid and name not in names
+            ]
+            for job, parts in indexed:
+                covering = [(j.db_index, p, j.ts < job.ts) for j, p in indexed if j.db_index != job.db_index]
+                for name, other, identical in covering + existing:
+                    if self._covers(other, parts, identical):
+                        ret[job] = name
+                        break
+        return ret
+
+    @staticmethod
+    def _covers(other, parts, identical):
+        """Check whether the index is covered by another one, or by the identical one if allowed"""
+        unique, method, columns, clauses = parts
+        if unique or clauses['INCLUDE'] or method != 'btree' or other[1] != 'btree':
+            return False
+        if clauses['WHERE'] != other[3]['WHERE'] or columns != other[2][:len(columns)]:
+            return False
+        return len(columns) < len(other[2]) or other[0] or identical
+
+    def _indexdef_parts(self, definition):
+        """Uniqueness, access method, columns and clauses of the canonical index definition"""
+        unique, tail = self._indexdef_key(definition)
+        method, _, tail = tail.partition(' ')
+        enclosed = self._extract_enclosed(tail)
+        columns = []
+        depth = 0
+        quote = None
+        column = ''
+        for c in enclosed + ',':
+            if quote:
+                quote = None if c == quote else quote
+            elif c in '\'"':
+                quote = c
+            elif c == '(':
+                depth += 1
+            elif c == ')':
+                depth -= 1
+            elif c == ',' and depth == 0:
+                columns.append(column.strip())
+                column = ''
+                continue
+            column += c
+        tail = tail[tail.index(enclosed) + len(enclosed) + 1:]
+        clauses = {}
+        for clause in ('WHERE', 'WITH', 'INCLUDE'):
+            tail, _, clauses[clause] = tail.partition(' %s ' % clause)
+        return unique, method, columns, clauses
+
+    def _claim(self, job):
+        """
+        Claim the job for this worker, the job failed in a previous run starts counting attempts again.
+
+        The job is claimed only if it is not leased by another worker,
+        no other job on the same table is leased, and no prerequisite
+        is waiting to be applied.
+        """
+        table = PostponedSQL._meta.db_table
+        with transaction.atomic(using=self.database), connections[self.database].cursor() as cursor:
+            # Serialize claims on the same table between workers
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, hashtext(%s))', [self._lock_class, job.table or ''])
+            cursor.execute(
+                f"""
+                    UPDATE {table} SET
+                        claimed_by = %(worker)s, claimed_at = now(), heartbeat = now(),
+                        lease_until = now() + %(lease)s * interval '1 second',
+                        attempts = CASE WHEN error IS NOT NULL AND claimed_at IS NOT NULL THEN 0 ELSE attempts END
+                    WHERE ts = (
+                        SELECT p.ts FROM {table} p
+                        WHERE p.ts = %(ts)s AND NOT p.done
+                        AND (p.lease_until IS NULL OR p.lease_until < now())
+                        AND (p.error IS NULL OR p.claimed_at IS NULL OR p.claimed_at < %(started)s)
+                        AND NOT EXISTS (
+                            SELECT 1 FROM {table} o
+                            WHERE o.ts <> p.ts AND NOT o.done AND (
+                                (o.lease_until >= now() AND (
+                                    o."table" = p."table" OR o."table" IS NULL OR p."table" IS NULL
+                                ))
+                                OR (o.ts < p.ts AND o.error IS NULL AND (
+                                    o."table" IS NULL OR p."table" IS NULL
+                                    OR (o."table" = p."table" AND o.db_index = p.db_index)
+                                ))
+                            )
+                        )
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING claimed_by, claimed_at, lease_until, heartbeat, attempts
+                """, {'worker': self.worker, 'lease': self.lease, 'ts': job.ts, 'started': self._started}
+            )
+            row = cursor.fetchone()
+        if not row:
+            logger.debug('[%s] Job is not claimed: %s', self.database, job.description)
+            return False
+        job.claimed_by, job.claimed_at, job.lease_until, job.heartbeat, job.attempts = row
+        with self._lock:
+            self._claimed.add(job.ts)
+        return True
+
+    def _finished(self, job):
+        """Check whether the job has been applied or failed by another runner"""
+        row = PostponedSQL.objects.using(self.database).filter(ts=job.ts).values_list('done', 'error', 'claimed_at').first()
+        if not row:
+            return True
+        done, error, claimed_at = row
+        return done or bool(error and claimed_at and claimed_at >= self._started)
+
+    def _heartbeat(self, stop):
+        """Prolong leases of running jobs until stopped, reconnecting on errors"""
+        table = PostponedSQL._meta.db_table
+        try:
+            while not stop.wait(self.lease / 3):
+                with self._lock:
+                    claimed = list(self._claimed)
+                if not claimed:
+                    continue
+                try:
+                    with connections[self.database].cursor() as cursor:
+                        cursor.execute(
+                            f"""
+                                UPDATE {table} SET
+                                    heartbeat = now(), lease_until = now() + %(lease)s * interval '1 second'
+                                WHERE ts = ANY(%(claimed)s) AND claimed_by = %(worker)s AND NOT done
+                            """, {'worker': self.worker, 'lease': self.lease, 'claimed': claimed}
+                        )
+                        if cursor.rowcount < len(claimed):
+                            logger.warning('[%s] Lost leases of %s jobs', self.database, len(claimed) - cursor.rowcount)
+                except Exception as ex:
+                    logger.error('[%s] Heartbeat failed, reconnecting: %s', self.database, ex)
+                    # The next beat uses the new connection
+                    connections[self.database].close()
+        finally:
+            connections[self.database].close()
+
+    def _index_type(self, job):
+        """Lowercase access method of the index built by the job"""
+        if match := self._index_type_re.search(job.sql):
+            return (match.group('index_typeq') or match.group('index_type')).lower()
+        return 'btree'
+
+    def _timeout(self, job):
+        """Timeout of the job by the table, the index type, or the default one"""
+        for pattern, seconds in self.table_timeouts.items():
+            if job.table and fnmatchcase(job.table, pattern):
+                return seconds
+        if self._index_type(job) in self.index_type_timeouts:
+            return self.index_type_timeouts[self._index_type(job)]
+        return self.timeout
+
+    def _session(self, job):
+        """
+        Session settings of the job connection.
+
+        Adaptive settings are overridden by the default profile including the profile of the database,
+        then by the profile of the index type, the profile of the table, and settings passed explicitly.
+        """
+        session = self._adaptive_session(job) if self.adaptive_session and job.table else {}
+        session.update(self.session)
+        session.update(self.index_type_sessions.get(self._index_type(job)) or {})
+        for pattern, values in self.table_sessions.items():
+            if job.table and fnmatchcase(job.table, pattern):
+                session.update(values)
+                break
+        session.update(self.session_options)
+        return session
+
+    def _adaptive_session(self, job):
+        """
+        Memory and parallel workers sized by the table of the job.
+
+        Parallel workers of the server are shared by jobs applied in parallel, and the server
+        decides itself how many of them to use by the table size. The memory shared by the leader
+        and workers grows with the table size up to the share of the memory limit.
+        """
+        with connections[self.database].cursor() as cursor:
+            cursor.execute(
+                """
+                    SELECT
+                        COALESCE(pg_relation_size(to_regclass(quote_ident(%s))), 0),
+                        LEAST(current_setting('max_worker_processes')::int, current_setting('max_parallel_workers')::int)
+                """, [job.table]
+            )
+            size, workers = cursor.fetchone()
+        workers = workers // self.jobs
+        # The server needs at least 32 MB per participant to use parallel workers
+        memory = max(min(size, self.adaptive_memory // self.jobs), 64 * 1024 * 1024, 32 * 1024 * 1024 * (workers + 1))
+        return {
+            'maintenance_work_mem': '%dkB' % (memory // 1024),
+            'max_parallel_maintenance_workers': workers,
+        }
+
+    def _tune(self, job):
+        """Apply session settings to the job connection closed after the job"""
+        session = self._session(job)
+        if not session:
+            return
+        logger.info(
+            '[%s] Session: %s: %s', self.database, ', '.join('%s=%s' % item for item in session.items()), job.description
+        )
+        with connections[self.database].cursor() as cursor:
+            for name, value in session.items():
+                cursor.execute('SELECT set_config(%s, %s, false)', [name, str(value)])
+
+    def _watchdog(self, stop):
+        """Cancel running jobs exceeding their timeouts and detect blockers until stopped"""
+        checked = time.monotonic()
+        try:
+            while not stop.wait(self.poll_interval):
+                now = time.monotonic()
+                with self._lock:
+                    expired = [(j, t) for j, t, deadline in self._deadlines.values() if deadline <= now]
+                for job, timeout in expired:
+                    try:
+                        self._cancel(job, 'Timeout: exceeded %g seconds' % timeout, retry=False)
+                    except Exception as ex:
+                        logger.error('[%s] Cancel failed: %s: %s', self.database, ex, job.description)
+                        connections[self.database].close()
+                if now - checked >= self.blocker_interval:
+                    checked = now
+                    # Blocker detection never stops the timeout enforcement
+                    try:
+                        self._detect_blockers()
+                    except Exception as ex:
+                        logger.error('[%s] Blocker detection failed: %s', self.database, ex)
+                        connections[self.database].close()
+        finally:
+            connections[self.database].close()
+
+    def _detect_blockers(self):
+        """Log and store sessions blocking running jobs, terminate idle in transaction ones if configured"""
+        with self._lock:
+            running = [(self._running[ts], pid) for ts, pid in self._pids.items()]
+        for job, pid in running:
+            try:
+                blockers = self._blockers_of(pid)
+            except Exception as ex:
+                logger.error('[%s] Blocker detection failed: %s: %s', self.database, ex, job.description)
+                connections[self.database].close()
+                continue
+            with self._lock:
+                known = self._blockers.get(job.ts)
+                if known is None:
+                    # The job is finished
+                    continue
+                new = [b for b in blockers if b['pid'] not in known or b.get('terminated')]
+                known.update((b['pid'], b) for b in blockers)
+                stored = list(known.values())
+            for blocker in new:
+                logger.warning(
+                    '[%s] %s is waiting for %s blocked by pid %s (%s, transaction age %.0f s%s): %s',
+                    self.database, job.description, blocker['waiting'], blocker['pid'], blocker['state'],
+                    blocker['xact_age'],
+                    ', terminated' if blocker.get('terminated') else (
+                        ', termination failed: %s' % blocker['terminate_error'] if blocker.get('terminate_error') else ''
+                    ),
+                    blocker['query']
+                )
+            if new:
+                PostponedSQL.objects.using(self.database).filter(ts=job.ts).update(blockers=json.dumps(stored))
+
+    def _blockers_of(self, pid):
+        """Sessions blocking the backend, idle in transaction ones are terminated if configured"""
+        with connections[self.database].cursor() as cursor:
+            cursor.execute(
+                """
+                    SELECT
+                        a.pid, a.state, a.usename, a.application_name, a.query,
+                        EXTRACT(EPOCH FROM now() - a.xact_start),
+                        EXTRACT(EPOCH FROM now() - a.state_change),
+                        (
+                            SELECT string_agg(DISTINCT l.locktype || ' ' || l.mode, ', ')
+                            FROM pg_locks l WHERE l.pid = %(pid)s AND NOT l.granted
+                        )
+                    FROM pg_stat_activity a WHERE a.pid = ANY(pg_blocking_pids(%(pid)s))
+                """, {'pid': pid}
+            )
+            ret = []
+            for blocker, state, user, application, query, xact_age, state_age, waiting in cursor.fetchall():
+                info = {
+                    'pid': blocker, 'state': state, 'user': user, 'application': application, 'query': query,
+                    'xact_age': float(xact_age or 0), 'waiting': waiting,
+                }
+                threshold = self.terminate_idle_in_transaction
+                idle = (state or '').startswith('idle in transaction')
+                if threshold is not None and idle and float(state_age or 0) > threshold:
+                    try:
+                        # Raises when the role is not allowed to terminate the session
+                        cursor.execute('SELECT pg_terminate_backend(%s)', [blocker])
+                        info['terminated'] = cursor.fetchone()[0]
+                    except DatabaseError as ex:
+                        info['terminated'] = False
+                        info['terminate_error'] = str(ex).strip()
+                ret.append(info)
+            return ret
+
+    def _tablespace(self, job):
+        """Tablespace of the index built by the job, explicit or the default one of the job connection"""
+        if not self.tablespace_jobs and not self.disk_probe:
+            return None
+        if match := self._tablespace_re.search(job.sql):
+            return match.group('tablespace_nameq') or match.group('tablespace_name')
+        return self._disk_settings_of(job)[0]
+
+    def _disk_settings_of(self, job):
+        """
+        Default tablespace, temporary tablespace and `maintenance_work_mem` in bytes of the job connection.
+
+        Settings of the session profile are applied in the transaction rolled back, the tablespace
+        of the database is used when the `default_tablespace` or `temp_tablespaces` is empty.
+        The temporary tablespace is the first one of the `temp_tablespaces`.
+        """
+        if job.ts in self._disk_settings:
+            return self._disk_settings[job.ts]
+        names = ('default_tablespace', 'temp_tablespaces', 'maintenance_work_mem')
+        session = {k: v for k, v in self._session(job).items() if k in names}
+        try:
+            row = self._query_disk_settings(session)
+        except DatabaseError as ex:
+            logger.warning('[%s] Session settings are not applicable, server ones are used: %s: %s', self.database, ex, job.description)
+            row = self._query_disk_settings({})
+        default, temporary, memory, database = row
+        temporary = [t.strip().strip('"') for t in temporary.split(',') if t.strip()]
+        self._disk_settings[job.ts] = (default or database, temporary[0] if temporary else database, memory)
+        return self._disk_settings[job.ts]
+
+    def _query_disk_settings(self, session):
+        """Settings affecting the disk space with the session settings applied"""
+        with transaction.atomic(using=self.database):
+            with connections[self.database].cursor() as cursor:
+                for name, value in session.items():
+                    cursor.execute('SELECT set_config(%s, %s, true)', [name, str(value)])
+                cursor.execute(
+                    """
+                        SELECT
+                            current_setting('default_tablespace'), current_setting('temp_tablespaces'),
+                            (SELECT setting::bigint * 1024 FROM pg_settings WHERE name = 'maintenance_work_mem'),
+                            (
+                                SELECT t.spcname FROM pg_database d JOIN pg_tablespace t ON t.oid = d.dattablespace
+                                WHERE d.datname = current_database()
+                            )
+                    """
+                )
+                row = cursor.fetchone()
+            transaction.set_rollback(True, using=self.database)
+        return row
+
+    def _run_job(self, job):
+        """Run a single job in the worker thread storing the result, returns success or None to be retried"""
+        self._local.job = job
+        try:
+            job.error = None
+            job.done = False
+            with connections[self.database].cursor() as cursor:
+                cursor.execute('SELECT pg_backend_pid()')
+                pid = cursor.fetchone()[0]
+            with self._lock:
+                self._pids[job.ts] = pid
+                self._running[job.ts] = job
+                self._blockers[job.ts] = {}
+                if timeout := self._timeout(job):
+                    self._deadlines[job.ts] = (job, timeout, time.monotonic() + timeout)
+            self._tune(job)
+            started = time.monotonic()
+            self._apply(job)
+            job.duration = time.monotonic() - started
+            if job.table:
+                job.pages = self._pages([job.table]).get(job.table)
+            self._analyze(job)
+            self._wait_replicas(job)
+            job.attempts = 0
+            self._release(job)
+            return True
+        except Exception as ex:
+            # The connection may be broken by the error
+            connections[self.database].close_if_unusable_or_obsolete()
+            with self._lock:
+                cancelled = self._cancelled.get(job.ts)
+            if not cancelled:
+                # Cancelled jobs are not counted as failed attempts
+                job.attempts += 1
+            if cancelled:
+                reason, retry = cancelled
+                logger.info('[%s] %s: %s', self.database, reason, job.description)
+                self._drop_invalid(job)
+                job.error = reason
+                if retry:
+                    # The cancelled job may be claimed again
+                    job.claimed_at = None
+                    self._release(job)
+                    return None
+            elif self._transient(ex) and job.attempts < self.max_attempts:
+                # The persisted number of attempts is shared by all workers
+                backoff = min(self.retry_backoff * 2 ** (job.attempts - 1), self.retry_backoff_max)
+                logger.warning(
+                    '[%s] Transient error on running job, retry in %g seconds: %s', self.database, backoff, ex
+                )
+                self._drop_invalid(job)
+                job.error = 'Retry %s: %s' % (job.attempts, ex)
+                # The job to be retried may be claimed again by any worker after the backoff
+                job.claimed_at = None
+                self._release(job, backoff)
+                with self._lock:
+                    self._not_before[job.ts] = time.monotonic() + backoff
+                return None
+            logger.warning('[%s] Error on running job: %s', self.database, ex)
+            if not job.error:
+                job.error = 'Exception: %s' % ex
+            self._release(job)
+            if self.exception:
+                raise
+            return False
+        finally:
+            with self._lock:
+                self._pids.pop(job.ts, None)
+                self._running.pop(job.ts, None)
+                self._blockers.pop(job.ts, None)
+                self._cancelled.pop(job.ts, None)
+                self._deadlines.pop(job.ts, None)
+                self._space.pop(job.ts, None)
+            self._local.job = None
+            if self.semaphore:
+                self.semaphore.release()
+            # Every worker thread has it's own connection
+            connections[self.database].close()
+
+    def _needs_analyze(self, job):
+        """Check whether the applied job needs fresh statistics of the table"""
+        if not job.done or not job.table or self.analyze == 'none':
+            return False
+        if not (match := self._create_index_re.fullmatch(job.sql)):
+            return False
+        if self.analyze == 'all':
+            return True
+        # Statistics of index expressions and predicate columns are used by the planner
+        rest = match.group('rest')
+        return '(' in self._extract_enclosed(rest) or 'WHERE' in self._clauses(rest)
+
+    def _analyze(self, job):
+        """
+        Analyze the table of the job if needed when no more jobs on it are pending.
+
+        Jobs on the same table are never applied in parallel, so the table
+        with several new indexes is analyzed once after the last one.
+        """
+        if not job.table:
+            return
+        with self._lock:
+            if self._needs_analyze(job):
+                self._unanalyzed.add(job.table)
+            if job.table not in self._unanalyzed or job.table in self._pending_tables:
+                return
+            self._unanalyzed.discard(job.table)
+        self._analyze_table(job.table)
+
+    def _analyze_table(self, table):
+        """Analyze the table, errors are not fatal"""
+        try:
+            self._execute('ANALYZE "%s"' % table)
+        except Exception as ex:
+            logger.warning('[%s] Error on analyzing %s: %s', self.database, table, ex)
+        finally:
+            with self._lock:
+                self._unanalyzed.discard(table)
+
+    def _drop_invalid(self, job):
+        """Drop the invalid index left by the cancelled job, including the new copy left by the reindex"""
+        if not job.db_index:
+            return
+        try:
+            with connections[self.database].cursor() as cursor:
+                cursor.execute(
+                    """
+                        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                        WHERE NOT i.indisvalid AND (c.relname = %s OR c.relname LIKE %s)
+                        AND c.relnamespace = 'public'::regnamespace
+                    """, [job.db_index, job.db_index.replace('_', '\\_') + '\\_ccnew%']
+                )
+                for name, in cursor.fetchall():
+                    sql = 'DROP INDEX CONCURRENTLY IF EXISTS "%s"' % name
+                    logger.info('[%s] SQL: %s', self.database, sql)
+                    cursor.execute(sql)
+        except Exception as ex:
+            logger.warning('[%s] Error on dropping the invalid index: %s', self.database, ex)
+
+    def _wait_replicas(self, job):
+        """Wait until replicas have replayed the applied job, bounded by the replica wait time"""
+        if not self.replica_wait:
+            return
+        with connections[self.database].cursor() as cursor:
+            cursor.execute('SELECT pg_current_wal_lsn()')
+            lsn = cursor.fetchone()[0]
+            deadline = time.monotonic() + self.replica_wait
+            while True:
+                cursor.execute(
+                    """
+                        SELECT application_name, bool_and(COALESCE(replay_lsn >= %s::pg_lsn, false))
+                        FROM pg_stat_replication GROUP BY application_name
+                    """, [lsn]
+                )
+                replayed = dict(cursor.fetchall())
+                lagging = sorted(
+                    name for name in (self.replicas or replayed) if not replayed.get(name)
+                )
+                if not lagging:
+                    return
+                if time.monotonic() >= deadline:
+                    logger.warning(
+                        '[%s] Replicas have not replayed %s till %s: %s',
+                        self.database, job.description, lsn, ', '.join(lagging)
+                    )
+                    job.error = 'Replicas have not replayed till %s: %s' % (lsn, ', '.join(lagging))
+                    return
+                time.sleep(self.poll_interval)
+
+    def _transient(self, ex):
+        """Check whether the error is transient by the SQLSTATE"""
+        if isinstance(ex, InterfaceError):
+            return True
+        sqlstate = self._sqlstate(ex)
+        if sqlstate is None:
+            # The connection is lost without the server response
+            return isinstance(ex, OperationalError)
+        return any(sqlstate.startswith(s) for s in self.retry_sqlstates)
+
+    def _release(self, job, backoff=None):
+        """
+        Store the job result releasing the lease, unless the job has been claimed by another worker.
+
+        The job to be retried keeps the lease for the backoff seconds, so no worker claims it earlier.
+        """
+        with self._lock:
+            self._claimed.discard(job.ts)
+        job.lease_until = None
+        fields = ['error', 'done', 'claimed_at', 'duration', 'pages', 'attempts']
+        values = {f: getattr(job, f) for f in fields}
+        values['lease_until'] = ExpressionWrapper(
+            Now() + timedelta(seconds=backoff), output_field=DateTimeField()
+        ) if backoff else None
+        if not PostponedSQL.objects.using(self.database).filter(ts=job.ts, claimed_by=self.worker).update(**values):
+            logger.warning('[%s] Lost the lease, the result is not stored: %s', self.database, job.description)
+
+    def _execute(self, sql):
+        """Execute a single SQL statement"""
+        job = getattr(self._local, 'job', None)
+        with self._lock:
+            if job and job.ts in self._cancelled:
+                raise JobCancelled('The job has been cancelled')
+        logger.info('[%s] SQL: %s', self.database, sql)
+        with connections[self.database].cursor() as cursor:
+            cursor.execute(sql)
+
+    def _execute_exclusive(self, sql):
+        """
+        Execute a brief statement taking the exclusive lock on the table.
+
+        The statement is executed under the short lock timeout to avoid blocking
+        other queries queued behind it, and retried with jittered delays until the deadline.
+        """
+        if not self.lock_timeout:
+            return self._execute(sql)
+        deadline = time.monotonic() + self.lock_retry_deadline
+        attempt = 0
+        while True:
+            try:
+                with transaction.atomic(using=self.database):
+                    with connections[self.database].cursor() as cursor:
+                        cursor.execute("SET LOCAL lock_timeout = '%dms'" % (self.lock_timeout * 1000))
+                    self._execute(sql)
+                return
+            except OperationalError as ex:
+                if self._sqlstate(ex) != '55P03' or time.monotonic() >= deadline:
+                    raise
+                delay = random.uniform(0, min(self.lock_timeout * 2 ** attempt, self.lock_retry_delay_max))
+                delay = min(delay, max(0, deadline - time.monotonic()))
+                logger.info('[%s] Lock is not available, retry in %.1f seconds: %s', self.database, delay, sql)
+                time.sleep(delay)
+                attempt += 1
+
+    def _clauses(self, rest):
+        """Clauses of the index definition following the column list by the upper case name"""
+        ret = {}
+        depth = 0
+        quote = None
+        for i, c in enumerate(rest):
+            if quote:
+                quote = None if c == quote else quote
+            elif c in '\'"':
+                quote = c
+            elif c == '(':
+                depth += 1
+            elif c == ')':
+                depth -= 1
+            elif depth == 0 and (match := self._clause_re.match(rest, i)):
+                ret.setdefault(match.group('clause').upper(), match)
+        return ret
+
+    def _storage(self, rest, storage):
+        """
+        Add storage parameters not set explicitly to the WITH clause of the index definition.
+
+        Returns the index definition and names of added parameters to be reset after the build.
+        """
+        if not storage:
+            return rest, []
+        clauses = self._clauses(rest)
+        position = min([m.start() for m in clauses.values()], default=len(rest))
+        existing = rest.index('(', clauses['WITH'].end()) if 'WITH' in clauses else None
+        if existing is None:
+            parameters = ['%s = %s' % item for item in storage.items()]
+            return '%s WITH (%s)%s' % (rest[:position], ', '.join(parameters), rest[position:]), list(storage)
+        enclosed = self._extract_enclosed(rest[existing:])
+        names = {p.partition('=')[0].strip().lower() for p in enclosed.split(',')}
+        added = [k for k in storage if k.lower() not in names]
+        if not added:
+            return rest, []
+        end = existing + 1 + len(enclosed)
+        parameters = ['%s = %s' % (k, storage[k]) for k in added]
+        return '%s, %s%s' % (rest[:end], ', '.join(parameters), rest[end:]), added
+
+    def _expected(self, unique, table_name, rest):
+        """
+        Definition of the index canonicalized by the server, None if unable to canonicalize.
+
+        The server creates the index on the empty temporary copy of the table to be compared with existing ones.
+        """
+        try:
+            with transaction.atomic(using=self.database):
+                with connections[self.database].cursor() as cursor:
+                    cursor.execute(
+                        'CREATE TEMPORARY TABLE "postpone_index_compare" (LIKE "%s") ON COMMIT DROP' % table_name
+                    )
+                    cursor.execute('CREATE %sINDEX "postpone_index_compare_index" ON "postpone_index_compare" %s' % (
+                        unique,
+                        rest,
+                    ))
+                    cursor.execute('SELECT pg_get_indexdef(%s::regclass)', ['"postpone_index_compare_index"'])
+                    expected = cursor.fetchone()[0]
+                transaction.set_rollback(True, using=self.database)
+            return expected
+        except Exception as ex:
+            logger.info('[%s] Unable to compare existing indexes on %s: %s', self.database, table_name, ex)
+            return None
+
+    def _indexes(self, table_name):
+        """Validity, definition and whether the constraint uses the index by the index name on the table"""
+        with connections[self.database].cursor() as cursor:
+            cursor.execute(
+                """
+                    SELECT
+                        c.relname, i.indisvalid, pg_get_indexdef(i.indexrelid),
+                        EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = i.indexrelid)
+                    FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE i.indrelid = to_regclass(%s)
+                """, ['"%s"' % table_name]
+            )
+            return {name: row for name, *row in cursor.fetchall()}
+
+    def _managed(self, table_name):
+        """
+        Names of indexes and constraints known to models or jobs, never adopted.
+
+        Names generated by Django for field indexes, foreign keys, unique fields,
+        `unique_together` and `index_together` of models on the table are included.
+        """
+        ret = set(
+            PostponedSQL.objects.using(self.database).filter(table=table_name).exclude(db_index=None)
+            .values_list('db_index', flat=True)
+        )
+        schema_editor = connections[self.database].schema_editor()
+        for model in apps.get_models():
+            ret.update(i.name for i in model._meta.indexes)
+            ret.update(c.name for c in model._meta.constraints)
+            if model._meta.db_table != table_name:
+                continue
+            for field in model._meta.local_fields:
+                if field.column:
+                    for suffix in ('', '_like', '_uniq'):
+                        ret.add(schema_editor._create_index_name(table_name, [field.column], suffix=suffix))
+            for suffix, together in (('_uniq', 'unique_together'), ('_idx', 'index_together')):
+                for fields in getattr(model._meta, together, None) or ():
+                    columns = [model._meta.get_field(f).column for f in fields]
+                    ret.add(schema_editor._create_index_name(table_name, columns, suffix=suffix))
+        return ret
+
+    def _existing(self, unique, index_name, table_name, rest):
+        """
+        Name and validity of the existing index equivalent to the definition, None if there is no such index.
+
+        The index having the same name is preferred, otherwise the valid equivalent index
+        not known to models and jobs is found to be adopted.
+        """
+        indexes = self._indexes(table_name)
+        if index_name not in indexes and not (self.adopt and indexes):
+            return None
+        if not (expected := self._expected(unique, table_name, rest)):
+            return None
+        # Definitions are the same besides the index and table names
+        key = self._indexdef_key(expected)
+        if index_name in indexes:
+            valid, definition, _ = indexes[index_name]
+            if self._indexdef_key(definition) == key:
+                return index_name, valid
+            logger.info('[%s] The existing index differs from the expected: %s', self.database, definition)
+        if self.adopt:
+            managed = self._managed(table_name)
+            for name, (valid, definition, constrained) in sorted(indexes.items()):
+                if valid and not constrained and name not in managed and self._indexdef_key(definition) == key:
+                    return name, valid
+        return None
+
+    @staticmethod
+    def _indexdef_key(definition):
+        """Uniqueness and the part of the index definition after the index and table names"""
+        return definition.startswith('CREATE UNIQUE '), definition.partition(' USING ')[2]
+
+    def _build(self, unique, index_name, table_name, rest):
+        """
+        Build the index unless the equivalent valid one exists, returns whether the index is built.
+
+        The identical invalid index left by the crashed runner is rebuilt in place,
+        the equivalent index having another name is adopted by renaming.
+        """
+        existing = self._existing(unique, index_name, table_name, rest)
+        if existing and existing[0] != index_name:
+            logger.info('[%s] The equivalent index %s is adopted as %s', self.database, existing[0], index_name)
+            self._execute_exclusive('DROP INDEX IF EXISTS "%s"' % (
+                index_name,
+            ))
+            self._execute_exclusive('ALTER INDEX "%s" RENAME TO "%s"' % (
+                existing[0],
+                index_name,
+            ))
+            return False
+        if existing and existing[1]:
+            logger.info('[%s] The identical valid index %s exists, not rebuilt', self.database, index_name)
+            return False
+        if unique and self.check_duplicates:
+            self._check_duplicates(table_name, rest)
+        if existing and connections[self.database].pg_version >= 120000:
+            self._execute('REINDEX INDEX CONCURRENTLY "%s"' % (
+                index_name,
+            ))
+            return True
+        self._execute_exclusive('DROP INDEX IF EXISTS "%s"' % (
+            index_name,
+        ))
+        self._execute('CREATE %sINDEX CONCURRENTLY "%s" ON "%s" %s' % (
+            unique,
+            index_name,
+            table_name,
+            rest
+        ))
+        return True
+
+    def _check_duplicates(self, table_name, rest):
+        """
+        Check the table for duplicate keys before building the unique index, storing found keys on the job.
+
+        The whole table is scanned when the index on the key columns may be used or the table is small,
+        otherwise the sample of about the scan pages limit is scanned. Found duplicates are always real,
+        while the sample may miss some of them.
+        """
+        job = self._local.job
+        if '(' in self._extract_enclosed(rest):
+            logger.info('[%s] Duplicates of expressions are not checked: %s', self.database, job.description)
+            return
+        columns = self._extract_column_names(rest)
+        clauses = self._clauses(rest)
+        conditions = [] if 'NULLS NOT DISTINCT' in rest.upper() else ['%s IS NOT NULL' % c for c in columns]
+        if 'WHERE' in clauses:
+            conditions.append('(%s)' % rest[clauses['WHERE'].end():].strip())
+        with connections[self.database].cursor() as cursor:
+            cursor.execute(
+                """
+                    SELECT EXISTS (
+                        SELECT 1 FROM pg_index i
+                        WHERE i.indrelid = to_regclass(%s) AND i.indisvalid AND i.indpred IS NULL
+                        AND (SELECT array_agg(k ORDER BY k) FROM unnest((i.indkey::int2[])[0:%s - 1]) k) = (
+                            SELECT array_agg(attnum ORDER BY attnum) FROM pg_attribute
+                            WHERE attrelid = i.indrelid AND attname = ANY(%s)
+                        )
+                    )
+                """, ['"%s"' % table_name, len(columns), [c.strip('"') for c in columns]]
+            )
+            indexed = cursor.fetchone()[0]
+            pages = self._pages([table_name]).get(table_name) or 0
+            sample = ''
+            if not indexed and pages > self.duplicates_scan_pages:
+                sample = ' TABLESAMPLE SYSTEM (%g)' % (100.0 * self.duplicates_scan_pages / pages)
+            sql = 'SELECT %s, count(*) FROM "%s"%s%s GROUP BY %s HAVING count(*) > 1 ORDER BY count(*) DESC, %s LIMIT %d' % (
+                ', '.join(columns),
+                table_name,
+                sample,
+                ' WHERE %s' % ' AND '.join(conditions) if conditions else '',
+                ', '.join(columns),
+                ', '.join(columns),
+                self.duplicates_limit,
+            )
+            logger.info('[%s] SQL: %s', self.database, sql)
+            cursor.execute(sql)
+            groups = [{'key': list(row[:-1]), 'count': row[-1]} for row in cursor.fetchall()]
+        duplicates = json.dumps({'columns': columns, 'sampled': bool(sample), 'groups': groups}, default=str)
+        PostponedSQL.objects.using(self.database).filter(ts=job.ts).update(duplicates=duplicates if groups else None)
+        if groups:
+            raise DuplicateKeys('Duplicate keys (%s) found: %s' % (
+                ', '.join(columns),
+                '; '.join('(%s) x %s' % (', '.join(str(k) for k in g['key']), g['count']) for g in groups[:3]),
+            ))
+
+    def _apply(self, job):
+        """Apply a single job"""
+        if match := self._create_index_re.fullmatch(job.sql):
+            unique = match.group('unique') or ''
+            index_name = match.group('index_nameq') or match.group('index_name')
+            table_name = match.group('table_nameq') or match.group('table_name')
+            rest, storage = self._storage(match.group('rest'), self.index_type_storage.get(self._index_type(job)))
+            built = self._build(unique, index_name, table_name, rest)
+            if storage:
+                # Storage parameters tune the build only, the index keeps parameters of the migration
+                self._execute_exclusive('ALTER INDEX "%s" RESET (%s)' % (
+                    index_name,
+                    ', '.join(storage),
+                ))
+            if built:
+                if finalize := self.index_type_finalize.get(self._index_type(job)):
+                    self._execute(finalize % ("'\"%s\"'" % index_name))
+        elif match := self._add_constraint_re.fullmatch(job.sql):
+            unique = 'UNIQUE '
+            index_name = match.group('index_nameq') or match.group('index_name')
+            table_name = match.group('table_nameq') or match.group('table_name')
+            rest = match.group('rest')
+            if job.ts not in self._built:
+                with connections[self.database].cursor() as cursor:
+                    cursor.execute(
+                        'SELECT conindid FROM pg_constraint WHERE conname = %s AND conrelid = to_regclass(%s)',
+                        [index_name, '"%s"' % table_name]
+                    )
+                    constraint = cursor.fetchone()
+                if constraint and self._existing(unique, index_name, table_name, rest) == (index_name, True):
+                    logger.info('[%s] The identical constraint %s exists, not added', self.database, index_name)
+                    job.error = None
+                    job.done = True
+                    return
+                if constraint:
+                    self._execute_exclusive('ALTER TABLE "%s" DROP CONSTRAINT IF EXISTS "%s"' % (
+                        table_name,
+                        index_name,
+                    ))
+                self._build(unique, index_name, table_name, rest)
+                # The index is not rebuilt when only the attach step is retried
+                self._built.add(job.ts)
+            self._execute_exclusive('ALTER TABLE "%s" ADD CONSTRAINT "%s" UNIQUE USING INDEX "%s"' % (
+                table_name,
+                index_name,
+                index_name,
+            ))
+        else:
+            logger.info('[%s] Unrecognized: %s', self.database, job.sql)
+            self._execute(job.sql)
+        job.error = None
+        job.done = True
+
+
+class ClusterRunner:
+    """
+    Applies not yet applied postponed jobs of several database aliases in one process.
+
+    Every database alias is applied by it's own runner in a separate thread.
+    The total number of jobs applied in parallel on all database aliases is limited.
+    """
+
+    def __init__(
+        self, databases=None, all_databases=False, exception=False,
+        jobs=None, database_jobs=None, cluster_jobs=None, **options
+    ):
+        """Initialize by the command options falling back to the settings"""
+        self.databases = databases or ['default']
+        self.all_databases = all_databases
+        self.exception = exception
+        self.jobs = jobs
+        self.database_jobs = dict(getattr(settings, 'POSTPONE_INDEX_DATABASE_JOBS', None) or {})
+        self.database_jobs.update(database_jobs or {})
+        self.cluster_jobs = cluster_jobs or getattr(settings, 'POSTPONE_INDEX_CLUSTER_JOBS', None)
+        self.interrupted = threading.Event()
+        self.options = options
+
+    def run(self):
+        """
+        Apply all not yet applied jobs of all database aliases.
+
+        Returns jobs left because of the time budget with their estimated durations by the database alias.
+        """
+        databases = self._databases()
+        semaphore = threading.BoundedSemaphore(self.cluster_jobs) if self.cluster_jobs else None
+        abort = threading.Event()
+        if len(databases) == 1 and not semaphore:
+            left = self._runner(databases[0], semaphore, abort).run()
+            return {databases[0]: left} if left else {}
+        failures = []
+        left = {}
+        with ThreadPoolExecutor(max_workers=len(databases) or 1, thread_name_prefix='postpone_index_database') as pool:
+            futures = {pool.submit(self._run, database, semaphore, abort): database for database in databases}
+            for future in futures:
+                try:
+                    if jobs := future.result():
+                        left[futures[future]] = jobs
+                except Exception as ex:
+                    logger.warning('[%s] Error on running jobs: %s', futures[future], ex)
+                    failures.append(ex)
+        if failures:
+            raise failures[0]
+        return left
+
+    def _run(self, database, semaphore, abort):
+        """Apply jobs of a single database alias in the separate thread"""
+        try:
+            return self._runner(database, semaphore, abort).run()
+        finally:
+            connections[database].close()
+
+    def _runner(self, database, semaphore, abort):
+        """Create runner for the database alias"""
+        return Runner(
+            database=database, exception=self.exception,
+            jobs=self.database_jobs.get(database, self.jobs),
+            semaphore=semaphore, abort=abort, interrupted=self.interrupted, **self.options
+        )
+
+    def _databases(self):
+        """Database aliases where the postponed jobs storage is present"""
+        ret = []
+        for database in (connections if self.all_databases else self.databases):
+            if self.all_databases and connections[database].vendor != 'postgresql':
+                continue
+            if not router.allow_migrate(database, PostponedSQL._meta.app_label, model_name=PostponedSQL._meta.model_name):
+                logger.debug('[%s] Skipped by the database router', database)
+                continue
+            try:
+                present = PostponedSQL.objects.using(database)._is_present()
+            except Exception as ex:
+                logger.warning('[%s] Skipped: %s', database, ex)
+                continue
+            if not present:
+                # The table has not been created
+                logger.debug('[%s] Skipped, the PostponedSQL storage is absent', database)
+                continue
+            ret.append(database)
+        return ret
+
+
+class Worker:
+    """
+    Long-running worker applying jobs as soon as they are postponed.
+
+    The worker holds a single connection listening on the notification channel.
+    The notification is sent by the trigger on every insert into the PostponedSQL table,
+    and by the `post_migrate` signal if configured. Jobs are not started while the `migrate` command
+    holding the shared advisory lock is running, so later migrations never wait for index builds.
+    """
+    channel = 'postpone_index'
+    _migrate_lock_class = 0x6d696772
+
+    def __init__(self, database='default', poll=None, exit_idle=None, **options):
+        """Initialize by the command options falling back to the settings"""
+        self.database = database
+        self.interrupted = threading.Event()
+        self.poll = poll or getattr(settings, 'POSTPONE_INDEX_WORKER_POLL', 60)
+        self.exit_idle = exit_idle or getattr(settings, 'POSTPONE_INDEX_WORKER_EXIT_IDLE', None)
+        self.options = options
+        self._started = None
+        self._waiting = False
+
+    def run(self):
+        """Apply jobs on every notification until the worker is idle for too long"""
+        connection = connections[self.database]
+        listening = False
+        active = time.monotonic()
+        while not self.interrupted.is_set():
+            try:
+                if not listening:
+                    with connection.cursor() as cursor:
+                        cursor.execute('LISTEN %s' % self.channel)
+                    listening = True
+                    logger.info('[%s] Listening on %s', self.database, self.channel)
+                if not self._started:
+                    # Jobs failed since the worker start are not retried on every wakeup
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT now()')
+                        self._started = cursor.fetchone()[0]
+                migrating = self._migrating(connection)
+                if migrating and not self._waiting:
+                    logger.info('[%s] Migration is running, jobs are started after it is finished', self.database)
+                self._waiting = migrating
+                if not migrating and PostponedSQL.objects.using(self.database)._is_present():
+                    Runner(
+                        database=self.database, interrupted=self.interrupted, started=self._started, **self.options
+                    ).run()
+                if self._wait(connection, self._timeout(active)):
+                    active = time.monotonic()
+                elif self.exit_idle and time.monotonic() - active >= self.exit_idle:
+                    logger.info('[%s] Idle for %s seconds, exiting', self.database, self.exit_idle)
+                    return
+            except (OperationalError, InterfaceError) as ex:
+                logger.warning('[%s] Connection lost, reconnecting: %s', self.database, ex)
+                connection.close()
+                listening = False
+                self.interrupted.wait(self.poll)
+
+    def _migrating(self, connection):
+        """Check whether the `migrate` command is running on the database"""
+        with transaction.atomic(using=self.database), connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_xact_lock(%s, 0)', [self._migrate_lock_class])
+            return not cursor.fetchone()[0]
+
+    @classmethod
+    def migration_started(cls, database):
+        """Hold the shared advisory lock by the `migrate` command until the migration is finished"""
+        connection = connections[database]
+        if getattr(connection, '_postpone_index_migrating', False):
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock_shared(%s, 0)', [cls._migrate_lock_class])
+        connection._postpone_index_migrating = True
+
+    @classmethod
+    def migration_finished(cls, database):
+        """Release the shared advisory lock held by the `migrate` command"""
+        connection = connections[database]
+        if not getattr(connection, '_postpone_index_migrating', False):
+            return
+        connection._postpone_index_migrating = False
+        if connection.connection is None:
+            # The session lock is released with the connection
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock_shared(%s, 0)', [cls._migrate_lock_class])
+
+    def _timeout(self, active):
+        """Time to wait for the next notification"""
+        if not self.exit_idle:
+            return self.poll
+        return max(0, min(self.poll, self.exit_idle - (time.monotonic() - active)))
+
+    def _wait(self, connection, timeout):
+        """Wait for notifications until interrupted, returns received notifications"""
+        deadline = time.monotonic() + timeout
+        while not self.interrupted.is_set():
+            notifies = self._receive(connection, min(1.0, max(0, deadline - time.monotonic())))
+            if notifies or time.monotonic() >= deadline:
+                return notifies
+        return []
+
+    def _receive(self, connection, timeout):
+        """Receive notifications waiting up to the timeout"""
+        raw = connection.connection
+        if callable(getattr(raw, 'notifies', None)):
+            # psycopg 3
+            return list(raw.notifies(timeout=timeout, stop_after=1))
+        # psycopg2
+        if select.select([raw], [], [], timeout) != ([], [], []):
+            raw.poll()
+        notifies = list(raw.notifies)
+        raw.notifies.clear()
+        return notifies
+
+    @classmethod
+    def wake(cls, database):
+        """Wake the listening worker up"""
+        with connections[database].cursor() as cursor:
+            cursor.execute('NOTIFY %s' % cls.channel)
+
+    @classmethod
+    def spawn(cls, database):
+        """
+        Start the worker in a separate process exiting when idle.
+
+        The worker runs by the `django` module with the settings module and the import path
+        of this process, whatever the entry point of this process is.
+        """
+        args = [sys.executable, '-m', 'django', 'apply_postponed', 'worker']
+        if settings.SETTINGS_MODULE:
+            args += ['--settings', settings.SETTINGS_MODULE]
+        args += [
+            '--database', database,
+            '--exit-idle', str(getattr(settings, 'POSTPONE_INDEX_WORKER_EXIT_IDLE', None) or 60),
+        ]
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(os.path.abspath(p) for p in sys.path))
+        logger.info('[%s] Starting worker: %s', database, ' '.join(args))
+        subprocess.Popen(args, env=env, start_new_session=True)
@@ -6,9 +6,41 @@ CREATE TABLE IF NOT EXISTS public.postpone_index_postponedsql (
     db_index character varying,
     fields character varying,
     "done" boolean NOT NULL DEFAULT FALSE,
-    "error" text
+    "error" text,
+    app_label character varying,
+    migration character varying,
+    claimed_by character varying,
+    claimed_at timestamp with time zone,
+    lease_until timestamp with time zone,
+    heartbeat timestamp with time zone,
+    duration double precision,
+    pages bigint,
+    attempts integer NOT NULL DEFAULT 0,
+    blockers text,
+    duplicates text
 );
+ALTER TABLE public.postpone_index_postponedsql ADD COLUMN IF NOT EXISTS app_label character varying;
+ALTER TABLE public.postpone_index_postponedsql ADD COLUMN IF NOT EXISTS migration character varying;
+ALTER TABLE public.postpone_index_postponedsql ADD COLUMN IF NOT EXISTS claimed_by character varying;
+ALTER TABLE public.postpone_index_postponedsql ADD COLUMN IF NOT EXISTS claimed_at timestamp with time zone;
+ALTER TABLE public.postpone_index_postponedsql ADD COLUMN IF NOT EXISTS lease_until timestamp with time zone;
+ALTER TABLE public.postpone_index_postponedsql ADD COLUMN IF NOT EXISTS heartbeat timestamp with time zone;
+ALTER TABLE public.postpone_index_postponedsql ADD COLUMN IF NOT EXISTS duration double precision;
+ALTER TABLE public.postpone_index_postponedsql ADD COLUMN IF NOT EXISTS pages bigint;
+ALTER TABLE public.postpone_index_postponedsql ADD COLUMN IF NOT EXISTS attempts integer NOT NULL DEFAULT 0;
+ALTER TABLE public.postpone_index_postponedsql ADD COLUMN IF NOT EXISTS blockers text;
+ALTER TABLE public.postpone_index_postponedsql ADD COLUMN IF NOT EXISTS duplicates text;
 CREATE INDEX IF NOT EXISTS postpone_index_postponedsql_db_index ON public.postpone_index_postponedsql USING btree (db_index);
 CREATE INDEX IF NOT EXISTS postpone_index_postponedsql_db_index_like ON public.postpone_index_postponedsql USING btree (db_index varchar_pattern_ops);
 CREATE INDEX IF NOT EXISTS postpone_index_postponedsql_table ON public.postpone_index_postponedsql USING btree ("table");
 CREATE INDEX IF NOT EXISTS postpone_index_postponedsql_table_like ON public.postpone_index_postponedsql USING btree ("table" varchar_pattern_ops);
+CREATE INDEX IF NOT EXISTS postpone_index_postponedsql_pending ON public.postpone_index_postponedsql USING btree ("table", ts) WHERE NOT "done";
+CREATE OR REPLACE FUNCTION public.postpone_index_postponedsql_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('postpone_index', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS postpone_index_postponedsql_notify ON public.postpone_index_postponedsql;
+CREATE TRIGGER postpone_index_postponedsql_notify AFTER INSERT ON public.postpone_index_postponedsql
+    FOR EACH STATEMENT EXECUTE PROCEDURE public.postpone_index_postponedsql_notify();
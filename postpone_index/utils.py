@@ -31,11 +31,16 @@ class Utils:
         re.IGNORECASE | re.MULTILINE
     )
     _drop_index_re = re.compile(
-        r'^\s*DROP\s+INDEX\s+(IF\s+EXISTS\s+)?'
+        r'^\s*DROP\s+INDEX\s+(CONCURRENTLY\s+)?(IF\s+EXISTS\s+)?'
         r'(((?P<iq>")?(?P<index_nameq>[^"]+)(?P=iq))|(?P<index_name>[^\s]+))'
         r'(?P<rest>.*)$',
         re.IGNORECASE | re.MULTILINE
     )
+    _non_transactional_re = re.compile(
+        r'^\s*(CREATE\s+(UNIQUE\s+)?INDEX\s+CONCURRENTLY|DROP\s+INDEX\s+CONCURRENTLY|REINDEX\s.*\sCONCURRENTLY|VACUUM|'
+        r'CREATE\s+DATABASE|DROP\s+DATABASE|ALTER\s+SYSTEM)\b',
+        re.IGNORECASE | re.DOTALL
+    )
     _drop_table_re = re.compile(
         r'^\s*DROP\s+TABLE\s+(IF\s+EXISTS\s+)?'
         r'(("?)public("?)\.)?(((?P<tq>")?(?P<table_nameq>[^"]+)(?P=tq))|(?P<table_name>[_a-zA-Z0-9]+))'
@@ -85,6 +90,15 @@ class Utils:
         r'(?P<rest>.*)$',
         re.IGNORECASE | re.MULTILINE
     )
+    _tablespace_re = re.compile(
+        r'\sTABLESPACE\s+'
+        r'(((?P<sq>")?(?P<tablespace_nameq>[^"]+)(?P=sq))|(?P<tablespace_name>[^\s]+))',
+        re.IGNORECASE | re.MULTILINE
+    )
+    _index_type_re = re.compile(
+        r'\sUSING\s+(((?P<mq>")?(?P<index_typeq>[^"]+)(?P=mq))|(?P<index_type>[_a-zA-Z0-9]+))\s*\(',
+        re.IGNORECASE | re.MULTILINE
+    )
     _column_name_re = re.compile(
         r'(((?P<cq>")(?P<column_nameq>[^"]+)(?P=cq))|(?P<column_name>[^\s]+))',
         re.IGNORECASE | re.MULTILINE
@@ -127,3 +141,9 @@ class Utils:
         if end == 0:
             return rest
         return rest[start:end]
+
+    @staticmethod
+    def _sqlstate(ex):
+        """SQLSTATE code of the database error if any"""
+        cause = ex.__cause__ or ex
+        return getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
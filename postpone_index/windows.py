@@ -0,0 +1,76 @@
+"""
+Maintenance windows allowing to start postponed jobs.
+"""
+from zoneinfo import ZoneInfo
+
+from django.utils import timezone
+
+
+class Window:
+    """
+    Maintenance window defined by the cron-like expression.
+
+    The expression `minute hour day month weekday` matches every minute inside the window,
+    f.e. `* 0-5 * * 1-5` defines the window from 00:00 till 06:00 on working days.
+    The expression may be prefixed by the `CRON_TZ=<zone>` time zone,
+    the current Django time zone is used by default.
+    """
+    _ranges = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        self.expression = expression
+        parts = expression.split()
+        self.tz = None
+        if parts and parts[0].startswith('CRON_TZ='):
+            self.tz = ZoneInfo(parts.pop(0)[len('CRON_TZ='):])
+        if len(parts) != len(self._ranges):
+            raise ValueError('%r is not a cron-like expression' % expression)
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self._field(part, low, high) for part, (low, high) in zip(parts, self._ranges)
+        ]
+        if 7 in self.weekdays:
+            # Both 0 and 7 are Sunday
+            self.weekdays.add(0)
+        self._any_day = parts[2] == '*'
+        self._any_weekday = parts[4] == '*'
+
+    def __str__(self):
+        return self.expression
+
+    @staticmethod
+    def _field(part, low, high):
+        """Values matched by the expression field"""
+        ret = set()
+        for item in part.split(','):
+            item, _, step = item.partition('/')
+            if item == '*':
+                start, end = low, high
+            else:
+                start, _, end = item.partition('-')
+                start = int(start)
+                end = int(end) if end else (high if step else start)
+            if not low <= start <= end <= high:
+                raise ValueError('%r is out of range %s-%s' % (part, low, high))
+            ret.update(range(start, end + 1, int(step or 1)))
+        return ret
+
+    def __contains__(self, moment):
+        """Check whether the moment is inside the window, the naive moment is in the current time zone"""
+        if timezone.is_aware(moment):
+            moment = timezone.localtime(moment, self.tz)
+        elif self.tz is not None:
+            # Naive when USE_TZ is false
+            moment = timezone.make_aware(moment).astimezone(self.tz)
+        day = moment.day in self.days
+        weekday = moment.isoweekday() % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            day = day and weekday
+        else:
+            # Like cron, either day field should match when both are restricted
+            day = day or weekday
+        return all((
+            moment.minute in self.minutes,
+            moment.hour in self.hours,
+            moment.month in self.months,
+            day,
+        ))